@@ -0,0 +1,75 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class IVFIndex:
+    """Inverted-file (IVF) partitioning of unit-normalised embeddings.
+
+    ``train`` runs spherical k-means to get ``nlist`` centroids; every event
+    row is then tagged with its nearest centroid. A query only scores rows in
+    the ``nprobe`` lists whose centroids are closest to it, trading recall for
+    speed. The per-row list tags live in the owning index (one int32 column),
+    so inserts and deletes are plain column writes. Rows tagged ``-1`` were
+    added before training and are always scored.
+    """
+
+    def __init__(self, nlist=None, nprobe=8, iterations=10, sample_size=50000, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids = None
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def train(self, vectors):
+        """Centroids for ``vectors``; only installed once the caller sets ``centroids``."""
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > self.sample_size:
+            vectors = vectors[rng.choice(len(vectors), self.sample_size, replace=False)]
+        nlist = self.nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            counts = np.bincount(assignment, minlength=nlist)
+            empty = counts == 0
+            # Re-seed empty clusters from random points instead of letting them die
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+        logger.info(f"Trained IVF index with {nlist} lists on {len(vectors)} vectors")
+        return centroids.astype(np.float32)
+
+    def assign(self, vectors, chunk_size=8192):
+        lists = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk_size):
+            block = vectors[start:start + chunk_size]
+            lists[start:start + chunk_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return lists
+
+    def probe(self, query, nprobe=None):
+        """Boolean lookup over list tags: ``probe(q)[lists]`` masks the rows to score."""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        scores = self.centroids @ query
+        nearest = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        lookup = np.zeros(len(self.centroids) + 1, dtype=bool)
+        lookup[nearest] = True
+        lookup[-1] = True
+        return lookup
+
+    def stats(self):
+        return {
+            "trained": self.trained,
+            "nlist": len(self.centroids) if self.trained else self.nlist,
+            "nprobe": self.nprobe,
+        }
@@ -519,78 +519,1138 @@ if __name__ == '__main__':
     logger.info(f"Debug mode: {debug}")
 
     app.run(host='0.0.0.0', port=port, debug=debug)'''
-from flask import Flask, request, jsonify
-from sentence_transformers import SentenceTransformer, util
-from datetime import datetime
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
+from sentence_transformers import SentenceTransformer
+
+from ann import IVFIndex
+from batching import EncodeScheduler, deduplicate, length_buckets
+from embedding_cache import EmbeddingCache, TTLCache, UserEmbeddingMemo, normalize_keywords
+from event_index import NO_DATE, EventIndex, parse_event_date
+from interactions import CoRegistrationModel, interaction_weight
+from popularity import PopularityCounter
+from lexical_index import LexicalIndex
+from metrics import StageStats, prometheus_gauges
+from profiling import RequestProfiler
+from ranking import SORT_KEYS, rank
+from sharded_index import ShardedEventIndex
+from quantization import INFERENCE_MODES, load_quantized
+import journal
+import snapshots
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Load model once
-model = SentenceTransformer('all-MiniLM-L6-v2')
+MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2 output size
+
+# "int8" runs the model with dynamically quantized linear layers under torch.inference_mode
+INFERENCE_MODE = os.environ.get("INFERENCE_MODE", "float32")
+if INFERENCE_MODE not in INFERENCE_MODES:
+    raise ValueError(f"INFERENCE_MODE must be one of {', '.join(INFERENCE_MODES)}")
+# Quantized models are cached here so a restart skips the conversion (empty disables the cache)
+QUANTIZED_MODEL_DIR = os.environ.get(
+    "QUANTIZED_MODEL_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-service")
+) or None
+# int8 embeddings differ slightly, so cached embeddings and snapshots are kept per mode
+EMBEDDING_MODEL = MODEL_NAME if INFERENCE_MODE == "float32" else f"{MODEL_NAME}-{INFERENCE_MODE}"
+
+# "background" opens the port at once and loads + warms the model in a thread,
+# "lazy" loads on the first request, "eager" blocks at import
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background")
+
+# Versioned index snapshots: memory-mapped at boot instead of re-embedding the catalogue
+INDEX_SNAPSHOT_DIR = os.environ.get("INDEX_SNAPSHOT_DIR") or None
+SNAPSHOT_KEEP = int(os.environ.get("SNAPSHOT_KEEP", 3))
+# Seconds between automatic snapshots of a changed index (0 disables them)
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", 0))
+# Set by gunicorn.conf.py: preforked workers keep their indexes in sync through the snapshots
+SHARED_INDEX = os.environ.get("SHARED_INDEX") == "1" and INDEX_SNAPSHOT_DIR is not None
+# Seconds between a shared worker's background syncs, which reload what requests only replay
+SYNC_INTERVAL = float(os.environ.get("SYNC_INTERVAL", 1))
+# Torch intra-op threads for this process (unset leaves torch's default)
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", 0))
+
+model = None
+_model_lock = threading.Lock()
+readiness = {
+    "model_loaded": False,
+    "warmed_up": False,
+    "index_restored": INDEX_SNAPSHOT_DIR is None,
+}
+
+# Number of texts per forward pass when encoding events
+ENCODE_BATCH_SIZE = int(os.environ.get("ENCODE_BATCH_SIZE", 64))
+# Padded tokens per forward pass; texts are bucketed by estimated token length within this budget
+ENCODE_MAX_TOKENS = int(os.environ.get("ENCODE_MAX_TOKENS", 8192))
+# Characters per token when estimating token lengths without running the tokenizer
+CHARS_PER_TOKEN = int(os.environ.get("CHARS_PER_TOKEN", 4))
+
+# Concurrent encode calls are coalesced for up to ENCODE_WINDOW_MS (0 encodes each call directly)
+ENCODE_WINDOW_MS = float(os.environ.get("ENCODE_WINDOW_MS", 5))
+ENCODE_MAX_BATCH = int(os.environ.get("ENCODE_MAX_BATCH", 128))
+
+# Event embeddings survive across requests; set EMBEDDING_CACHE_DIR to keep them across restarts too
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.environ.get("EMBEDDING_CACHE_SIZE", 50000)),
+    disk_dir=os.environ.get("EMBEDDING_CACHE_DIR") or None,
+    max_disk_entries=int(os.environ.get("EMBEDDING_CACHE_DISK_SIZE", 500000)),
+    namespace=EMBEDDING_MODEL,
+)
+
+# Dashboard refreshes and students with the same interests reuse one user vector
+user_memo = UserEmbeddingMemo(
+    max_entries=int(os.environ.get("USER_MEMO_SIZE", 10000)),
+    ttl=float(os.environ.get("USER_MEMO_TTL", 3600)),
+)
+
+# Whole /recommend responses per (profile, filters, options, index version); the TTL bounds
+# how long an event that started between expiry sweeps can linger in a cached list
+response_cache = TTLCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", 60)),
+)
+
+# Two-stage retrieval: when > 0, only this many top TF-IDF matches are re-ranked with MiniLM
+LEXICAL_CANDIDATES = int(os.environ.get("LEXICAL_CANDIDATES", 0))
+
+stage_stats = StageStats()
+
+# Opt-in cProfile: PROFILE_SAMPLE_RATE of requests (kept when slower than PROFILE_SLOW_MS),
+# or any request sent with ?profile=1 / an X-Profile header when PROFILE_REQUESTS=1
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS") == "1"
+profiler = RequestProfiler(
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+    slow_ms=float(os.environ.get("PROFILE_SLOW_MS", 500)),
+)
+
+# Partition the index by this event field (e.g. targetAudience or category); a query then only
+# scores the shards its filters name, in parallel on INDEX_SHARD_WORKERS threads
+INDEX_SHARD_KEY = os.environ.get("INDEX_SHARD_KEY") or None
+INDEX_SHARD_WORKERS = int(os.environ.get("INDEX_SHARD_WORKERS", 0)) or None
+# Event fields besides category that /recommend filters match by value; the shard key is always one
+FILTER_FIELDS = tuple(dict.fromkeys(
+    ("targetAudience",) + ((INDEX_SHARD_KEY,) if INDEX_SHARD_KEY not in (None, "category") else ())
+))
+
+
+def new_event_index():
+    # Past ANN_MIN_SIZE events, single-user queries only score the ANN_NPROBE nearest IVF lists
+    return EventIndex(
+        EMBEDDING_DIM,
+        ann=IVFIndex(
+            nlist=int(os.environ.get("ANN_NLIST", 0)) or None,
+            nprobe=int(os.environ.get("ANN_NPROBE", 8)),
+        ),
+        ann_min_size=int(os.environ.get("ANN_MIN_SIZE", 20000)),
+        dtype=os.environ.get("EMBEDDING_DTYPE", "float32"),
+        lexical=LexicalIndex() if LEXICAL_CANDIDATES else None,
+        lexical_candidates=LEXICAL_CANDIDATES,
+        stages=stage_stats,
+        filter_fields=FILTER_FIELDS,
+    )
+
+
+# Catalogue kept in sync by the backend through the /events endpoints
+event_index = (
+    ShardedEventIndex(INDEX_SHARD_KEY, new_event_index, workers=INDEX_SHARD_WORKERS, stages=stage_stats)
+    if INDEX_SHARD_KEY else new_event_index()
+)
+
+SIMILARITY_THRESHOLD = 0.2  # threshold can be adjusted
+
+# Item-item model over registrations; a recommendation scores
+# CONTENT_WEIGHT * similarity + COLLAB_WEIGHT * co-registration score
+interaction_model = CoRegistrationModel()
+CONTENT_WEIGHT = float(os.environ.get("CONTENT_WEIGHT", 1.0))
+COLLAB_WEIGHT = float(os.environ.get("COLLAB_WEIGHT", 0.3))
+
+# Seconds between sweeps that drop events which have already started (0 disables them)
+EXPIRE_INTERVAL = float(os.environ.get("EXPIRE_INTERVAL", 300))
+
+# Time-decayed registration counts behind /popular
+popularity = PopularityCounter(
+    half_life_days=float(os.environ.get("POPULARITY_HALF_LIFE_DAYS", 14)),
+    top_size=int(os.environ.get("POPULARITY_TOP_SIZE", 100)),
+)
+
+# Registration-derived state snapshotted in subdirectories of INDEX_SNAPSHOT_DIR
+side_stores = {"interactions": interaction_model, "popularity": popularity}
+
+# /recommend/batch encodes and scores this many users per user x event product
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", 256))
+# Batches larger than this are streamed back as NDJSON
+BATCH_STREAM_THRESHOLD = int(os.environ.get("BATCH_STREAM_THRESHOLD", 500))
+
+# /events/ingest upserts NDJSON events this many at a time as the lines arrive
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 256))
+# The only fields of an ingested record that are kept: embedding text plus what the index filters on
+INGEST_FIELDS = (
+    "event_id", "name", "description", "category", "location", "targetAudience", "tags",
+    "date", "isActive",
+)
+if INDEX_SHARD_KEY and INDEX_SHARD_KEY not in INGEST_FIELDS:
+    INGEST_FIELDS += (INDEX_SHARD_KEY,)
+
+
+def build_event_text(event):
+    # Canonical embedding text: whitespace collapsed, tags lowercased and sorted, ids and
+    # counts left out, and the short fields first so truncation at the model's maximum
+    # sequence length only ever cuts the end of the description
+    tags = sorted({str(tag).strip().lower() for tag in event.get("tags") or [] if str(tag).strip()})
+    fields = (
+        event.get("name"),
+        event.get("category"),
+        " ".join(tags),
+        event.get("targetAudience"),
+        event.get("location"),
+        event.get("description"),
+    )
+    return " ".join(" ".join(str(field).split()) for field in fields if field)
+
+
+def get_model():
+    # Load model once; concurrent callers wait for the first load
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                started = time.perf_counter()
+                if TORCH_NUM_THREADS:
+                    set_torch_threads(TORCH_NUM_THREADS)
+                if INFERENCE_MODE == "int8":
+                    loaded = load_quantized(
+                        MODEL_NAME, QUANTIZED_MODEL_DIR, lambda: SentenceTransformer(MODEL_NAME, device="cpu")
+                    )
+                else:
+                    loaded = SentenceTransformer(MODEL_NAME)
+                # encode() calls self.tokenize; the instance attribute lets it be timed separately
+                loaded.tokenize = timed_tokenize(loaded.tokenize)
+                dim = loaded.get_sentence_embedding_dimension()
+                if dim != EMBEDDING_DIM:
+                    raise RuntimeError(f"{MODEL_NAME} produces {dim}-d embeddings, expected {EMBEDDING_DIM}")
+                model = loaded
+                readiness["model_loaded"] = True
+                logger.info(f"Loaded {MODEL_NAME} ({INFERENCE_MODE}) in {time.perf_counter() - started:.1f}s")
+    return model
+
+
+def inference_context():
+    if INFERENCE_MODE == "float32":
+        return nullcontext()
+    import torch
+
+    return torch.inference_mode()
+
+
+def set_torch_threads(threads):
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def init_worker(threads):
+    # Called in each preforked worker; the model weights were loaded before fork
+    set_torch_threads(threads)
+    logger.info(f"Worker {os.getpid()} using {threads} torch threads")
+
+
+def warm_up():
+    # One full dummy batch so the first real request does not pay for lazy init
+    encode_texts([f"warm up event recommendation model {i}" for i in range(ENCODE_BATCH_SIZE)])
+    readiness["warmed_up"] = True
+
+
+def restore_index():
+    if INDEX_SNAPSHOT_DIR:
+        started = time.perf_counter()
+        restored = event_index.load_snapshot(INDEX_SNAPSHOT_DIR, model=EMBEDDING_MODEL)
+        logger.info(f"Restored {restored} events from {INDEX_SNAPSHOT_DIR} in {time.perf_counter() - started:.3f}s")
+        for name, store in side_stores.items():
+            store.load_snapshot(store_dir(name))
+        for name in ("index", *side_stores):
+            mark_synced(name)
+            if SHARED_INDEX:
+                with sync_locks[name]:
+                    catch_up(name, reload=True)
+    readiness["index_restored"] = True
+
+
+# Version of each store right after its last snapshot load or save; only local mutations move it on
+synced_versions = {}
+
+
+def mark_synced(name):
+    synced_versions[name] = store_object(name).version
+
+
+def store_object(name):
+    return event_index if name == "index" else side_stores[name]
+
+
+def store_dir(name):
+    if not INDEX_SNAPSHOT_DIR:
+        return None
+    return INDEX_SNAPSHOT_DIR if name == "index" else os.path.join(INDEX_SNAPSHOT_DIR, name)
+
+
+def load_store(name):
+    if name == "index":
+        event_index.load_snapshot(INDEX_SNAPSHOT_DIR, model=EMBEDDING_MODEL)
+    else:
+        side_stores[name].load_snapshot(store_dir(name))
+    mark_synced(name)
+
+
+def save_store(name):
+    if name == "index":
+        snapshot = event_index.save_snapshot(INDEX_SNAPSHOT_DIR, keep=SNAPSHOT_KEEP, model=EMBEDDING_MODEL)
+    else:
+        snapshot = side_stores[name].save_snapshot(store_dir(name), keep=SNAPSHOT_KEEP)
+    mark_synced(name)
+    return snapshot
+
+
+def refresh_store(name):
+    # Pick up a snapshot another process published since this one last synced
+    if snapshots.current_version(store_dir(name)) == store_object(name).snapshot:
+        return
+    try:
+        load_store(name)
+    except Exception as e:
+        logger.error(f"Refreshing {name} failed: {e}")
+
+
+# Shared updates are journaled (see journal.py) instead of republished in full.
+# Serialise catching up and journaled updates between the threads of this process
+sync_locks = {name: threading.Lock() for name in ("index", *side_stores)}
+sync_pid = None
+_sync_start_lock = threading.Lock()
+
+
+def recording_embed(arrays=None):
+    # An embed function for EventIndex.upsert and the {event_id: vector} it handed out. A replaying
+    # worker gets the writer's vectors in ``arrays`` and only encodes events the writer did not
+    vectors = dict(zip(arrays["ids"].tolist(), arrays["vectors"])) if arrays else {}
+
+    def embed(events):
+        ids = [str(event["event_id"]) for event in events]
+        missing = [event for event, event_id in zip(events, ids) if event_id not in vectors]
+        if missing:
+            vectors.update(zip((str(event["event_id"]) for event in missing), embed_events(missing)))
+        return np.vstack([vectors[event_id] for event_id in ids])
+    return embed, vectors
+
+
+def apply_index_change(change, arrays=None):
+    op = change["op"]
+    if op == "upsert":
+        events = change["events"]
+        embed, vectors = recording_embed(arrays)
+        encoded = event_index.upsert(events, [build_event_text(event) for event in events], embed)
+        return encoded, {
+            "ids": np.array(list(vectors), dtype=str),
+            "vectors": np.array(list(vectors.values()), dtype=np.float32).reshape(-1, EMBEDDING_DIM),
+        }
+    if op == "delete":
+        return event_index.delete(change["event_ids"]), None
+    if op == "retain":
+        keep = set(change["event_ids"])
+        missing = [event_id for event_id in list(event_index.ids) if event_id not in keep]
+        event_index.delete(missing)
+        return missing, None
+    if op == "set_active":
+        return event_index.set_active(change["event_ids"], change["active"]), None
+    if op == "expire":
+        return event_index.expire(change["now"]), None
+    raise ValueError(f"Unknown index change: {op}")
+
+
+def apply_change(name, change, arrays=None):
+    """Apply one change to a store, the same way in its writer and in every worker replaying it.
+
+    Returns the change's result and the arrays to journal with it.
+    """
+    if name == "index":
+        return apply_index_change(change, arrays)
+    if name == "interactions":
+        # (user_id, event_id, weight) triples: replaying them updates C incrementally
+        return interaction_model.update(change["interactions"]), None
+    return apply_popularity_change(change), None
+
+
+def apply_popularity_change(change):
+    op = change["op"]
+    if op == "record":
+        # The writer looked the categories up in its index, so every replay files events the same way
+        return popularity.record(change["registrations"], change["categories"])
+    if op == "set_categories":
+        return popularity.set_categories(change["categories"])
+    if op == "remove":
+        return popularity.remove(change["event_ids"])
+    raise ValueError(f"Unknown popularity change: {op}")
+
+
+def update_store(name, change):
+    """Apply ``change`` to a store; with shared workers also journal it for the others to replay."""
+    if not SHARED_INDEX:
+        return apply_change(name, change)[0]
+    store, directory = store_object(name), store_dir(name)
+    with sync_locks[name], snapshots.locked(directory):
+        catch_up(name, reload=True)
+        before = store.version
+        result, arrays = apply_change(name, change)
+        if store.version != before:
+            store.journal = journal.append(directory, change, arrays)
+        return result
+
+
+def catch_up(name, reload=False, remap=False):
+    """Replay the journal entries of a store that this process has not applied yet.
+
+    Entries already pruned into a snapshot need a reload first (``reload``);
+    ``remap`` also reloads when a newer snapshot was published, so the
+    index maps the file every worker shares. Without either (the request
+    path) such a store is left to the sync thread. The caller holds
+    ``sync_locks[name]``.
+    """
+    store, directory = store_object(name), store_dir(name)
+    entries = journal.read(directory, store.journal)
+    newer = remap and snapshots.current_version(directory) != store.snapshot
+    if entries is None or newer:
+        if not (reload or remap):
+            return
+        load_store(name)
+        entries = journal.read(directory, store.journal) or []
+    for seq, change, arrays in entries:
+        apply_change(name, change, arrays)
+        store.journal = seq
+
+
+def start_sync_thread():
+    # Threads do not survive fork: each worker starts its own on its first request
+    global sync_pid
+    if sync_pid == os.getpid():
+        return
+    with _sync_start_lock:
+        if sync_pid != os.getpid():
+            threading.Thread(target=sync_periodically, name="sync", daemon=True).start()
+            sync_pid = os.getpid()
+
+
+def sync_periodically():
+    # Full reloads (a pruned journal, or a newer snapshot of the index to map) happen here,
+    # never on the request path
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        for name in ("index", *side_stores):
+            try:
+                with sync_locks[name]:
+                    catch_up(name, reload=True, remap=name == "index")
+            except Exception as e:
+                logger.error(f"Syncing {name} failed: {e}")
+
+
+def expire_events():
+    # Under gunicorn this runs in the master, which serves no requests: catch up with the
+    # workers' journal first. The O(log n) check then keeps idle sweeps from taking the
+    # (cross-process) lock
+    if SHARED_INDEX:
+        with sync_locks["index"]:
+            catch_up("index", reload=True, remap=True)
+    if not event_index.expired():
+        return []
+    expired = update_store("index", {"op": "expire", "now": int(time.time())})
+    if expired:
+        update_store("popularity", {"op": "remove", "event_ids": expired})
+        logger.info(f"Expired {len(expired)} past events")
+    return expired
+
+
+def expire_periodically():
+    while True:
+        time.sleep(EXPIRE_INTERVAL)
+        try:
+            expire_events()
+        except Exception as e:
+            logger.error(f"Expiring past events failed: {e}")
+
+
+def snapshot_journal(directory):
+    # Last journal entry held by the published snapshot
+    path = snapshots.current_path(directory)
+    return snapshots.read_manifest(path).get("journal", 0) if path else 0
+
+
+def publish(name, force=False):
+    # Lock, catch up with what the other workers published, then save: always when forced, else
+    # only when this process holds changes the published snapshot lacks. A stale copy (e.g. the
+    # gunicorn master's) must never be published over newer snapshots
+    store, directory = store_object(name), store_dir(name)
+    with sync_locks[name]:
+        if not SHARED_INDEX:
+            with snapshots.locked(directory):
+                refresh_store(name)
+                if force or store.version != synced_versions.get(name):
+                    save_store(name)
+            return store.snapshot
+        # Shared workers: fold the journal into a snapshot and drop the entries the previous one held
+        with snapshots.locked(directory):
+            catch_up(name, reload=True)
+            folded = snapshot_journal(directory)
+            saved = force or store.journal != folded
+            if saved:
+                save_store(name)
+                journal.prune(directory, folded)
+        if saved and name == "index":
+            # Map the file just written rather than keep the copy that grew on the heap
+            load_store(name)
+            catch_up(name)
+        return store.snapshot
+
+
+def snapshot_periodically():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        for name in ("index", *side_stores):
+            try:
+                publish(name)
+            except Exception as e:
+                logger.error(f"Snapshot of {name} failed: {e}")
+
+
+def start_up():
+    try:
+        restore_index()
+        get_model()
+        warm_up()
+    except Exception as e:
+        logger.error(f"Startup failed: {e}")
+
+
+_tokenize_clock = threading.local()
+
+
+def timed_tokenize(tokenize):
+    def wrapper(texts):
+        started = time.perf_counter()
+        try:
+            return tokenize(texts)
+        finally:
+            elapsed = time.perf_counter() - started
+            stage_stats.record("tokenize", elapsed)
+            _tokenize_clock.seconds = getattr(_tokenize_clock, "seconds", 0.0) + elapsed
+    return wrapper
+
+
+def estimated_lengths(model, texts):
+    # Token counts guessed from text length (special tokens included), capped at the model's
+    # maximum sequence length. Bucketing only needs them roughly right, and encode() tokenizes anyway
+    return [min(len(text) // CHARS_PER_TOKEN + 2, model.max_seq_length) for text in texts]
+
+
+def run_model(texts, batch_size=ENCODE_BATCH_SIZE):
+    # Unit-normalised rows, so cosine similarity is a plain dot product. Identical texts
+    # are encoded once and each forward pass holds texts of similar (estimated) token length
+    model = get_model()
+    unique, inverse = deduplicate(texts)
+    vectors = np.zeros((len(unique), EMBEDDING_DIM), dtype=np.float32)
+    _tokenize_clock.seconds = 0.0
+    started = time.perf_counter()
+    lengths = estimated_lengths(model, unique)
+    padded = 0
+    with inference_context():
+        for rows in length_buckets(lengths, ENCODE_MAX_TOKENS, batch_size):
+            vectors[rows] = model.encode(
+                [unique[row] for row in rows],
+                batch_size=len(rows),
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            padded += len(rows) * lengths[rows[-1]]
+    # Everything encode() spent outside the tokenizer is the forward pass (plus pooling)
+    stage_stats.record("inference", time.perf_counter() - started - _tokenize_clock.seconds)
+    stage_stats.increment("encoded_texts_total", len(unique))
+    stage_stats.increment("deduplicated_texts_total", len(texts) - len(unique))
+    stage_stats.increment("estimated_tokens_total", sum(lengths))
+    stage_stats.increment("estimated_padded_tokens_total", padded)
+    return vectors[inverse]
+
+
+encode_scheduler = (
+    EncodeScheduler(run_model, max_batch_size=ENCODE_MAX_BATCH, max_wait_ms=ENCODE_WINDOW_MS)
+    if ENCODE_WINDOW_MS > 0 else None
+)
+
+
+def encode_texts(texts):
+    # A profiled request encodes on its own thread so the profile shows tokenizer and model time
+    if encode_scheduler is None or (has_request_context() and g.get("profile") is not None):
+        return run_model(texts)
+    return encode_scheduler.encode(texts)
+
+
+def embed_events(events):
+    # Only events whose id or text changed since the last call hit the model
+    texts = [build_event_text(event) for event in events]
+    items = [(str(event.get("event_id")), text) for event, text in zip(events, texts)]
+    vectors, missing = embedding_cache.get_many(items)
+    if missing:
+        fresh = encode_texts([texts[i] for i in missing])
+        for i, vector in zip(missing, fresh):
+            embedding_cache.put(items[i][0], items[i][1], vector)
+            vectors[i] = vector
+    return np.vstack(vectors)
+
+
+def embed_users(keyword_lists):
+    # The normalised keyword set is both the memo key and the text that gets encoded
+    keys = [normalize_keywords(keywords) for keywords in keyword_lists]
+    vectors = [user_memo.get(key) for key in keys]
+    missing = sorted({key for key, vector in zip(keys, vectors) if vector is None})
+    if missing:
+        fresh = dict(zip(missing, encode_texts(missing)))
+        for key, vector in fresh.items():
+            user_memo.put(key, vector)
+        vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+    return np.vstack(vectors)
+
+
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    explicit = PROFILE_REQUESTS and (request.args.get("profile") == "1" or "X-Profile" in request.headers)
+    g.profile = profiler.start(explicit)
+
+
+@app.after_request
+def count_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    stage_stats.record(f"request:{endpoint}", time.perf_counter() - g.started)
+    stage_stats.increment("requests_total", endpoint=endpoint, status=response.status_code)
+    stage_stats.increment("request_bytes_total", request.content_length or 0, endpoint=endpoint)
+    return response
+
+
+@app.teardown_request
+def finish_profile(exc):
+    # Runs even when the view raised, so the profiler is always released
+    if g.get("profile") is not None:
+        profiler.finish(g.profile, request.path)
+
+
+@app.before_request
+def sync_shared_index():
+    # Requests only replay journal entries; the sync thread does any full reload
+    if not SHARED_INDEX:
+        return
+    start_sync_thread()
+    for name in ("index", *side_stores):
+        # Skipped while another thread of this process catches up or writes
+        if not sync_locks[name].acquire(blocking=False):
+            continue
+        try:
+            catch_up(name)
+        except Exception as e:
+            logger.error(f"Catching up {name} failed: {e}")
+        finally:
+            sync_locks[name].release()
+
 
 @app.route("/recommend", methods=["POST"])
 def recommend_events():
     try:
-        data = request.json
-        print("hello")
+        with stage_stats.time("parse"):
+            data = request.json
         user_profile = data.get("user_profile", {})
-        keywords = (user_profile.get("interests", []) +
-                    user_profile.get("skills", []))
-        all_events = data.get("all_events", [])
-        relevant_event_ids = []
+        keywords = profile_keywords(user_profile)
+        all_events = data.get("all_events")
+
+        top_k, sort_by, error = ranking_options(data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        past_events = data.get("past_events") or []
+        if all_events is None:
+            return recommend_from_index(keywords, data.get("filters") or {}, top_k, sort_by, past_events)
 
         if not all_events or not keywords:
             return jsonify({"recommendations": []})
 
-        # Combine user keywords
-        user_text = " ".join(keywords)
-        user_embedding = model.encode(user_text, convert_to_tensor=True)
+        stage_stats.increment("request_events_total", len(all_events))
+        user_embedding = embed_users([keywords])[0] * CONTENT_WEIGHT
+
+        # Dates parsed once into an epoch column; active and past filtering as one mask
+        with stage_stats.time("filter"):
+            n = len(all_events)
+            active = np.fromiter((bool(e.get("isActive", False)) for e in all_events), dtype=bool, count=n)
+            dates = np.fromiter((parse_event_date(e.get("date")) for e in all_events), dtype=np.int64, count=n)
+            rows = np.flatnonzero(active & (dates > int(time.time())))
+        if not len(rows):
+            return jsonify({"recommendations": []})
 
-        for event in all_events:
-            if not event.get("isActive", False):
-                continue
+        candidates = [all_events[row] for row in rows]
 
-            # Skip past events
-            event_date_str = event.get("date")
-            try:
-                if event_date_str:
-                    event_date = datetime.fromisoformat(event_date_str.replace("Z", "+00:00"))
-                    if event_date < datetime.now():
-                        continue
-            except Exception:
-                pass
-
-            # Combine all important fields
-            event_text = " ".join([
-                str(event.get("name", "")),
-                str(event.get("description", "")),
-                str(event.get("category", "")),
-                str(event.get("location", "")),
-                str(event.get("targetAudience", "")),
-                " ".join(event.get("tags", [])),
-                str(event.get("createdBy", "")),
-                str(event.get("maxAttendees", "")),
-            ])
-
-            # Compute similarity
-            event_embedding = model.encode(event_text, convert_to_tensor=True)
-            similarity = util.cos_sim(user_embedding, event_embedding).item()
-
-            if similarity >= 0.2:  # threshold can be adjusted
-                relevant_event_ids.append(event.get("event_id"))
-
-        # Sort by date of the events (optional)
-        relevant_event_ids.sort(key=lambda eid: next(
-            (e.get("date", "9999-12-31T00:00:00") for e in all_events if e.get("event_id") == eid),
-            "9999-12-31T00:00:00"
-        ))
+        # Cached or batch-encoded embeddings, then a single matrix-vector product
+        with stage_stats.time("embed_events"):
+            event_embeddings = embed_events(candidates)
+        boosts = collaborative_boosts(past_events)
+        with stage_stats.time("similarity"):
+            similarities = event_embeddings @ user_embedding
+            if boosts:
+                similarities += np.fromiter(
+                    (boosts.get(str(event.get("event_id")), 0.0) for event in candidates),
+                    dtype=np.float32,
+                    count=len(candidates),
+                )
+
+        with stage_stats.time("rank"):
+            order = rank(similarities, dates[rows], threshold=SIMILARITY_THRESHOLD, top_k=top_k, sort_by=sort_by)
 
         # Return only IDs
-        return jsonify({"recommendations": relevant_event_ids})
+        return jsonify({"recommendations": [candidates[i].get("event_id") for i in order]})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def collaborative_boosts(past_events):
+    # COLLAB_WEIGHT-scaled item-item scores for the events this user registered for
+    if not past_events or not COLLAB_WEIGHT:
+        return {}
+    weights = {
+        str(event.get("event_id")): interaction_weight(event.get("rating"))
+        for event in past_events
+        if isinstance(event, dict) and event.get("event_id")
+    }
+    with stage_stats.time("collaborative"):
+        scores = interaction_model.scores(weights)
+    return {event_id: COLLAB_WEIGHT * score for event_id, score in scores.items()}
+
+
+def profile_keywords(user_profile):
+    return (user_profile.get("interests", []) +
+            user_profile.get("skills", []))
+
+
+def ranking_options(data):
+    top_k = data.get("top_k")
+    sort_by = data.get("sort_by", "date")
+    # bool is an int subclass: "top_k": true must not pass as 1
+    if top_k is not None and (not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 0):
+        return None, None, "top_k must be a non-negative integer"
+    if sort_by not in SORT_KEYS:
+        return None, None, f"sort_by must be one of {', '.join(SORT_KEYS)}"
+    return top_k, sort_by, None
+
+
+def parse_filters(filters):
+    filters = filters or {}
+    categories = filters.get("categories") or filters.get("category")
+    if isinstance(categories, str):
+        categories = [categories]
+    # e.g. {"targetAudience": ["Computer Science", "All Students"]}; a sharded index only visits those shards
+    fields = {field: filters[field] for field in FILTER_FIELDS if filters.get(field) is not None}
+    return categories, filters.get("exclude_event_ids"), parse_window(filters), fields
+
+
+def parse_window(filters):
+    # Start-time window from starts_after / starts_before dates and within_days; None when unbounded
+    start = parse_event_date(filters.get("starts_after"))
+    end = parse_event_date(filters.get("starts_before"))
+    within_days = filters.get("within_days")
+    if isinstance(within_days, (int, float)) and not isinstance(within_days, bool):
+        end = min(end, int(time.time() + within_days * 86400))
+    if start == NO_DATE and end == NO_DATE:
+        return None
+    return (None if start == NO_DATE else start), (None if end == NO_DATE else end)
+
+
+def response_cache_key(keywords, filters, top_k, sort_by, past_events):
+    # Versions first: any upsert, delete, expiry or new registration starts a fresh key space
+    history = sorted(
+        (str(event.get("event_id")), event.get("rating"))
+        for event in past_events or () if isinstance(event, dict)
+    )
+    return json.dumps(
+        [event_index.version, interaction_model.version, normalize_keywords(keywords), filters, top_k, sort_by, history],
+        sort_keys=True,
+        default=str,
+    )
+
+
+def recommend_from_index(keywords, filters, top_k=None, sort_by="date", past_events=None):
+    key = response_cache_key(keywords, filters, top_k, sort_by, past_events)
+    cached = response_cache.get(key)
+    if cached is None:
+        relevant_event_ids = search_index(keywords, filters, top_k, sort_by, past_events)
+        body = {
+            "recommendations": relevant_event_ids,
+            "index_size": len(event_index),
+            "interactions": len(interaction_model),
+        }
+        cached = (body, event_index.fingerprint(relevant_event_ids))
+        response_cache.put(key, cached)
+
+    body, etag = cached
+    # The ETag only covers the recommended events, so it matches across workers
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(body)
+    response.set_etag(etag)
+    return response
+
+
+def search_index(keywords, filters, top_k, sort_by, past_events):
+    if not keywords or not len(event_index):
+        return []
+
+    # Scaling the query scales every dot product, i.e. weights the content score
+    user_embedding = embed_users([keywords])[0] * CONTENT_WEIGHT
+    categories, exclude_ids, window, fields = parse_filters(filters)
+    return event_index.search(
+        user_embedding,
+        SIMILARITY_THRESHOLD,
+        categories=categories,
+        exclude_ids=exclude_ids,
+        top_k=top_k,
+        sort_by=sort_by,
+        query_text=normalize_keywords(keywords),
+        boosts=collaborative_boosts(past_events),
+        window=window,
+        fields=fields,
+    )
+
+
+def recommend_chunk(users, top_k, sort_by):
+    # One encode call and one user x event product for the whole chunk
+    keywords = [profile_keywords(user.get("user_profile") or {}) for user in users]
+    scored = [i for i, words in enumerate(keywords) if words]
+    results = [[] for _ in users]
+    if scored and len(event_index):
+        user_embeddings = embed_users([keywords[i] for i in scored]) * CONTENT_WEIGHT
+        filters = [parse_filters(users[i].get("filters")) for i in scored]
+        boosts = [collaborative_boosts(users[i].get("past_events")) for i in scored]
+        ranked = event_index.search_batch(
+            user_embeddings, SIMILARITY_THRESHOLD, filters, top_k=top_k, sort_by=sort_by, boosts=boosts
+        )
+        for i, recommendations in zip(scored, ranked):
+            results[i] = recommendations
+    return [
+        {"user_id": user.get("user_id"), "recommendations": recommendations}
+        for user, recommendations in zip(users, results)
+    ]
+
+
+def recommend_batches(users, top_k, sort_by):
+    for start in range(0, len(users), BATCH_CHUNK_SIZE):
+        yield from recommend_chunk(users[start:start + BATCH_CHUNK_SIZE], top_k, sort_by)
+
+
+@app.route("/recommend/batch", methods=["POST"])
+def recommend_batch():
+    try:
+        data = request.json or {}
+        users = data.get("users")
+        if not isinstance(users, list) or not all(isinstance(user, dict) for user in users):
+            return jsonify({"error": "users must be a list of objects"}), 400
+
+        top_k, sort_by, error = ranking_options(data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        if data.get("stream", len(users) > BATCH_STREAM_THRESHOLD):
+            # Only one chunk of scores is alive at a time
+            lines = (json.dumps(result) + "\n" for result in recommend_batches(users, top_k, sort_by))
+            return Response(lines, mimetype="application/x-ndjson")
+
+        return jsonify({
+            "results": list(recommend_batches(users, top_k, sort_by)),
+            "index_size": len(event_index),
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def event_ids_from(data):
+    event_ids = (data or {}).get("event_ids")
+    if not isinstance(event_ids, list):
+        return None
+    return [str(event_id) for event_id in event_ids]
+
+
+@app.route("/events", methods=["POST"])
+def upsert_events():
+    try:
+        events = (request.json or {}).get("events")
+        if not isinstance(events, list) or not all(isinstance(e, dict) and e.get("event_id") for e in events):
+            return jsonify({"error": "events must be a list of objects with an event_id"}), 400
+
+        encoded = update_store("index", {"op": "upsert", "events": events})
+        update_store("popularity", {
+            "op": "set_categories",
+            "categories": {str(event["event_id"]): event.get("category") for event in events},
+        })
+        return jsonify({"upserted": len(events), "encoded": encoded, "index_size": len(event_index)})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def read_ndjson_events(lines, errors):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            errors.append(f"line {number}: {e}")
+            continue
+        if not isinstance(record, dict) or not record.get("event_id"):
+            errors.append(f"line {number}: not an object with an event_id")
+            continue
+        yield {field: record[field] for field in INGEST_FIELDS if field in record}
+
+
+def ingest(lines, replace=False):
+    # Only one batch of records is held at a time; a progress record follows every batch
+    errors = []
+    seen = set()
+    progress = {"ingested": 0, "encoded": 0, "errors": 0}
+
+    def upsert(batch):
+        progress["encoded"] += update_store("index", {"op": "upsert", "events": batch})
+        update_store("popularity", {
+            "op": "set_categories",
+            "categories": {str(event["event_id"]): event.get("category") for event in batch},
+        })
+        progress["ingested"] += len(batch)
+        progress["errors"] = len(errors)
+        if replace:
+            seen.update(str(e["event_id"]) for e in batch)
+
+    started = time.perf_counter()
+    batch = []
+    for event in read_ndjson_events(lines, errors):
+        batch.append(event)
+        if len(batch) == INGEST_BATCH_SIZE:
+            upsert(batch)
+            batch = []
+            yield dict(progress)
+    if batch:
+        upsert(batch)
+    if replace:
+        missing = update_store("index", {"op": "retain", "event_ids": sorted(seen)})
+        progress["deleted"] = len(missing)
+        update_store("popularity", {"op": "remove", "event_ids": missing})
+    logger.info(f"Ingested {progress['ingested']} events in {time.perf_counter() - started:.1f}s")
+    yield {
+        **progress,
+        "errors": len(errors),
+        "error_samples": errors[:10],
+        "index_size": len(event_index),
+        "done": True,
+    }
+
+
+@app.route("/events/ingest", methods=["POST"])
+def ingest_events():
+    # Body: one JSON event per line; replace=1 also drops indexed events missing from the stream
+    replace = request.args.get("replace") in ("1", "true")
+    lines = (line.decode("utf-8", "replace") for line in request.stream)
+
+    def progress_lines():
+        try:
+            for progress in ingest(lines, replace):
+                yield json.dumps(progress) + "\n"
+        except Exception as e:
+            logger.error(f"Ingest failed: {e}")
+            yield json.dumps({"error": str(e), "done": False}) + "\n"
+
+    return Response(stream_with_context(progress_lines()), mimetype="application/x-ndjson")
+
+
+@app.route("/events/delete", methods=["POST"])
+def delete_events():
+    try:
+        event_ids = event_ids_from(request.json)
+        if event_ids is None:
+            return jsonify({"error": "event_ids must be a list"}), 400
+        deleted = update_store("index", {"op": "delete", "event_ids": event_ids})
+        update_store("popularity", {"op": "remove", "event_ids": event_ids})
+        return jsonify({"deleted": deleted, "index_size": len(event_index)})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/events/deactivate", methods=["POST"])
+def deactivate_events():
+    try:
+        event_ids = event_ids_from(request.json)
+        if event_ids is None:
+            return jsonify({"error": "event_ids must be a list"}), 400
+        deactivated = update_store("index", {"op": "set_active", "event_ids": event_ids, "active": False})
+        return jsonify({"deactivated": deactivated, "index_size": len(event_index)})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@app.route("/events/snapshot", methods=["POST"])
+def snapshot_events():
+    if not INDEX_SNAPSHOT_DIR:
+        return jsonify({"error": "INDEX_SNAPSHOT_DIR is not configured"}), 400
+    try:
+        return jsonify({
+            "snapshot": publish("index", force=True),
+            **{f"{name}_snapshot": publish(name, force=True) for name in side_stores},
+            "index_size": len(event_index),
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/interactions", methods=["POST"])
+def update_interactions():
+    try:
+        interactions = (request.json or {}).get("interactions")
+        if not isinstance(interactions, list) or not all(
+            isinstance(i, dict) and i.get("user_id") and i.get("event_id") for i in interactions
+        ):
+            return jsonify({"error": "interactions must be a list of objects with a user_id and an event_id"}), 400
+
+        triples = [
+            (str(i["user_id"]), str(i["event_id"]), interaction_weight(i.get("rating"), i.get("isActive", True)))
+            for i in interactions
+        ]
+        updated_users = update_store("interactions", {"op": "update", "interactions": triples})
+
+        now = time.time()
+        registrations = [
+            (user_id, event_id, registration_time(i.get("registeredAt"), now), bool(weight))
+            for (user_id, event_id, weight), i in zip(triples, interactions)
+        ]
+        counted = update_store("popularity", {
+            "op": "record",
+            "registrations": registrations,
+            "categories": event_index.categories({r[1] for r in registrations}),
+        })
+        return jsonify({
+            "updated_users": updated_users,
+            "counted": counted,
+            "interactions": len(interaction_model),
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def registration_time(value, default):
+    timestamp = parse_event_date(value)
+    return default if timestamp == NO_DATE else min(timestamp, default)
+
+
+@app.route("/popular", methods=["GET"])
+def popular_events():
+    # Walks a maintained top list: O(k) regardless of catalogue or registration count
+    try:
+        k = int(request.args.get("k", 10))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    if k < 0:
+        return jsonify({"error": "k must be a non-negative integer"}), 400
+    top = popularity.top(min(k, popularity.top_size), request.args.get("category"), eligible=event_index.upcoming)
+    return jsonify({"events": [{"event_id": event_id, "score": score} for event_id, score in top]})
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    # Liveness only: the process is up and serving
+    return jsonify({"status": "ok"})
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    # A lazy start loads the model on the first request, so only the index gates readiness
+    required = ("index_restored",) if STARTUP_MODE == "lazy" else tuple(readiness)
+    is_ready = all(readiness[key] for key in required)
+    return jsonify({"ready": is_ready, **readiness}), 200 if is_ready else 503
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Prometheus text format: stage latency histograms, request counters, cache and index gauges
+    prefix = "recommender"
+    lines = stage_stats.prometheus(prefix)
+    caches = {"embedding": embedding_cache.stats(), "user": user_memo.stats(), "response": response_cache.stats()}
+    for field in ("hits", "misses", "evictions"):
+        lines += prometheus_gauges(
+            prefix, f"cache_{field}_total", f"Cache {field}",
+            [({"cache": name}, cache[field]) for name, cache in caches.items()], kind="counter",
+        )
+    lines += prometheus_gauges(prefix, "cache_entries", "Entries held in memory",
+                               [({"cache": name}, cache["entries"]) for name, cache in caches.items()])
+    lines += prometheus_gauges(prefix, "index_events", "Events in the index", [({}, len(event_index))])
+    lines += prometheus_gauges(prefix, "index_version", "Index version of this process", [({}, event_index.version)])
+    lines += prometheus_gauges(prefix, "interactions", "Registrations in the co-registration model",
+                               [({}, len(interaction_model))])
+    if encode_scheduler is not None:
+        encoder = encode_scheduler.stats()
+        lines += prometheus_gauges(prefix, "encode_queue_depth", "Texts waiting for a model batch",
+                                   [({}, encoder["queue_depth"])])
+        lines += prometheus_gauges(prefix, "encode_batches_total", "Model batches run",
+                                   [({}, encoder["batches"])], kind="counter")
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/profiles", methods=["GET"])
+def profiles():
+    # Recent cProfile reports (see PROFILE_SAMPLE_RATE / PROFILE_REQUESTS), newest last
+    return jsonify({"profiles": profiler.reports()})
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({
+        "embedding_cache": embedding_cache.stats(),
+        "user_memo": user_memo.stats(),
+        "response_cache": response_cache.stats(),
+        "encoder": encode_scheduler.stats() if encode_scheduler is not None else None,
+        "inference_mode": INFERENCE_MODE,
+        "stages": stage_stats.stats(),
+        "event_index": event_index.stats(),
+        "interactions": interaction_model.stats(),
+        "popularity": popularity.stats(),
+    })
+
+if STARTUP_MODE == "eager":
+    start_up()
+elif STARTUP_MODE == "background":
+    threading.Thread(target=start_up, name="startup", daemon=True).start()
+else:
+    restore_index()
+
+if INDEX_SNAPSHOT_DIR and SNAPSHOT_INTERVAL > 0:
+    threading.Thread(target=snapshot_periodically, name="snapshots", daemon=True).start()
+
+if EXPIRE_INTERVAL > 0:
+    threading.Thread(target=expire_periodically, name="expiry", daemon=True).start()
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000, debug=True)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8000)), debug=os.environ.get("FLASK_ENV") == "development")
     #app.run(debug=True, port=8000)
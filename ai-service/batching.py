@@ -0,0 +1,164 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size histogram buckets; the last bucket is open-ended
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class EncodeScheduler:
+    """Coalesces concurrent encode calls into shared model batches.
+
+    Callers ``submit`` a list of texts and wait on the returned future. A
+    single worker thread takes the first pending request, keeps gathering
+    more for up to ``max_wait_ms`` or until ``max_batch_size`` texts are
+    queued, runs ``encode`` once on the concatenation and hands each caller
+    back its own rows. A request larger than ``max_batch_size`` runs alone.
+    """
+
+    def __init__(self, encode, max_batch_size=128, max_wait_ms=5):
+        self.encode_fn = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._carry = None
+        self._lock = threading.Lock()
+        self.queued_texts = 0
+        self.max_queued_texts = 0
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.batch_sizes = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self._pid = None
+
+    def _ensure_worker(self):
+        # Threads do not survive fork: each (pre)forked worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._carry = None
+                self.queued_texts = 0
+                threading.Thread(target=self._run, name="encode-scheduler", daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, texts):
+        future = Future()
+        if not texts:
+            future.set_result(None)
+            return future
+        self._ensure_worker()
+        with self._lock:
+            self.requests += 1
+            self.queued_texts += len(texts)
+            self.max_queued_texts = max(self.max_queued_texts, self.queued_texts)
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts):
+        return self.submit(texts).result()
+
+    def _next(self, timeout=None):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        return self._queue.get(timeout=timeout)
+
+    def _gather(self):
+        batch = [self._next()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._next(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(item[0]) > self.max_batch_size:
+                self._carry = item
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._gather()
+            with self._lock:
+                self.queued_texts -= size
+                self.batches += 1
+                self.texts += size
+                self.batch_sizes[self._bucket(size)] += 1
+            try:
+                vectors = self.encode_fn([text for texts, _ in batch for text in texts])
+            except Exception as e:
+                logger.error(f"Batched encode of {size} texts failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for texts, future in batch:
+                future.set_result(np.asarray(vectors[start:start + len(texts)]))
+                start += len(texts)
+
+    @staticmethod
+    def _bucket(size):
+        for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= bound:
+                return i
+        return len(BATCH_SIZE_BUCKETS)
+
+    def stats(self):
+        with self._lock:
+            bounds = [str(bound) for bound in BATCH_SIZE_BUCKETS] + ["+Inf"]
+            return {
+                "queue_depth": self.queued_texts,
+                "max_queue_depth": self.max_queued_texts,
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts": self.texts,
+                "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(zip(bounds, self.batch_sizes)),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+
+def deduplicate(texts):
+    """Distinct texts in first-seen order, and for each input the position of its text among them."""
+    positions = {}
+    inverse = np.fromiter(
+        (positions.setdefault(text, len(positions)) for text in texts), dtype=np.int64, count=len(texts)
+    )
+    return list(positions), inverse
+
+
+def length_buckets(lengths, max_tokens, max_batch_size):
+    """Row batches of similar token length for padded forward passes.
+
+    Rows are taken shortest first and a batch is closed before its padded
+    size (rows x longest row) would exceed ``max_tokens`` or it would hold
+    more than ``max_batch_size`` rows, so short texts share large batches
+    and long ones are not padded against short ones.
+    """
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    batches = []
+    batch = []
+    for row in order.tolist():
+        if batch and ((len(batch) + 1) * lengths[row] > max_tokens or len(batch) == max_batch_size):
+            batches.append(batch)
+            batch = []
+        batch.append(row)
+    if batch:
+        batches.append(batch)
+    return batches
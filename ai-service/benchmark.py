@@ -0,0 +1,317 @@
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Mirrors server/models/Event.js: category enum, lowercase tags, descriptions up to 2000 chars
+CATEGORIES = ("Technology", "Business", "Arts", "Science", "Sports", "Workshop", "Seminar", "Conference", "Social")
+TOPICS = {
+    "Technology": ["python", "javascript", "react", "machine learning", "ai", "cloud", "security", "web development"],
+    "Business": ["startup", "marketing", "finance", "entrepreneurship", "leadership", "sales", "strategy"],
+    "Arts": ["design", "photography", "painting", "music", "theatre", "digital art", "creative writing"],
+    "Science": ["physics", "chemistry", "biology", "astronomy", "research", "data analysis", "lab skills"],
+    "Sports": ["football", "basketball", "fitness", "yoga", "running", "swimming", "tournament"],
+    "Workshop": ["hands-on", "coding", "prototyping", "public speaking", "resume", "3d printing"],
+    "Seminar": ["career", "ethics", "sustainability", "policy", "innovation", "guest lecture"],
+    "Conference": ["networking", "keynote", "panel", "industry", "research papers", "hackathon"],
+    "Social": ["community", "volunteering", "games", "cultural", "food", "meetup", "mixer"],
+}
+FILLER = (
+    "students will explore practical sessions with experienced mentors and build projects together "
+    "covering fundamentals advanced techniques real world case studies teamwork feedback and networking "
+    "bring your laptop questions and curiosity refreshments provided certificates for participants"
+).split()
+LOCATIONS = ("Main Auditorium", "Computer Lab A", "Library Hall", "Sports Complex", "Innovation Hub", "Room 204")
+DEPARTMENTS = ("Computer Science", "Business Administration", "Arts", "Physics", "Biology", "Mechanical Engineering")
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+# Events per /events/ingest call, so no request body holds a whole large catalogue
+INGEST_CHUNK = 5000
+# Service settings recorded with each run, since they change the numbers
+KNOBS = (
+    "ENCODE_BATCH_SIZE", "ENCODE_WINDOW_MS", "ENCODE_MAX_BATCH", "EMBEDDING_DTYPE", "ANN_MIN_SIZE", "ANN_NPROBE",
+    "LEXICAL_CANDIDATES", "COLLAB_WEIGHT", "RESPONSE_CACHE_SIZE", "TORCH_NUM_THREADS", "INFERENCE_MODE",
+    "INDEX_SHARD_KEY", "INDEX_SHARD_WORKERS",
+)
+
+
+def event_id(i):
+    return f"evt{i:07d}"
+
+
+def audience(rng):
+    # Free text like the seeded events ("Computer Science and IT Students"), not a bare department
+    if rng.random() < 0.2:
+        return "All Students"
+    first, second = rng.sample(DEPARTMENTS, 2)
+    return rng.choice([f"{first} Students", f"{first} and {second} Students", f"{second} and {first} Students"])
+
+
+def synthetic_events(n, seed=0, now=None):
+    """``n`` Event-shaped records (a few inactive or past); the same seed gives the same catalogue."""
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    for i in range(n):
+        category = rng.choice(CATEGORIES)
+        tags = rng.sample(TOPICS[category], k=rng.randint(1, 5))
+        words = [rng.choice(FILLER + tags) for _ in range(rng.randint(20, 320))]
+        yield {
+            "event_id": event_id(i),
+            "name": f"{tags[0].title()} {rng.choice(['Workshop', 'Meetup', 'Talk', 'Bootcamp', 'Night'])} #{i}",
+            "description": " ".join(words)[:2000],
+            "category": category,
+            "location": rng.choice(LOCATIONS),
+            "targetAudience": audience(rng),
+            "tags": tags,
+            "createdBy": f"{rng.getrandbits(96):024x}",
+            "maxAttendees": rng.choice([20, 50, 100, 200, 500]),
+            "date": (now + timedelta(days=rng.uniform(-10, 120))).isoformat(),
+            "isActive": rng.random() > 0.05,
+        }
+
+
+def synthetic_requests(n, n_events, seed=1):
+    """``n`` /recommend bodies with User-shaped profiles and a few past registrations each."""
+    rng = random.Random(seed)
+    topics = [topic for values in TOPICS.values() for topic in values]
+    requests = []
+    for _ in range(n):
+        past = rng.sample(range(n_events), k=min(n_events, rng.randint(0, 4)))
+        requests.append({
+            "user_profile": {
+                "interests": rng.sample(topics, k=rng.randint(1, 5)),
+                "skills": rng.sample(topics, k=rng.randint(0, 3)),
+                "department": rng.choice(DEPARTMENTS),
+                "year": rng.randint(1, 4),
+            },
+            "past_events": [{"event_id": event_id(i), "rating": rng.choice([None, 3, 4, 5])} for i in past],
+        })
+    return requests
+
+
+def memory_mb(pid="self"):
+    # Current and peak resident set size from /proc (Linux)
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    values[key] = int(value.split()[0]) / 1024.0
+    except OSError:
+        return None, None
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def reset_peak_memory(pid="self"):
+    # Writing 5 to clear_refs resets VmHWM; not every kernel/container allows it
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+class InProcessClient:
+    """Calls the Flask app directly (no HTTP server), one test client per thread."""
+
+    pid = "self"
+
+    def __init__(self):
+        os.environ.setdefault("STARTUP_MODE", "eager")
+        os.environ.setdefault("EXPIRE_INTERVAL", "0")
+        import app as service
+
+        self.app = service.app
+        self._local = threading.local()
+
+    def post(self, path, body, content_type="application/json"):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.post(path, data=body, content_type=content_type)
+        return response.status_code, response.data
+
+
+class HTTPClient:
+    """Keep-alive HTTP client for a running service, one connection per thread."""
+
+    def __init__(self, url, pid=None):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.pid = pid
+        self._local = threading.local()
+
+    def post(self, path, body, content_type="application/json"):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=300)
+        connection.request("POST", path, body=body, headers={"Content-Type": content_type})
+        response = connection.getresponse()
+        return response.status, response.read()
+
+
+def load_catalogue(client, n, seed):
+    started = time.perf_counter()
+    batch = []
+    for i, event in enumerate(synthetic_events(n, seed)):
+        batch.append(json.dumps(event))
+        if len(batch) == INGEST_CHUNK or i == n - 1:
+            # The first chunk replaces whatever a previous run left in the index
+            query = "?replace=1" if i < INGEST_CHUNK else ""
+            status, body = client.post(f"/events/ingest{query}", "\n".join(batch) + "\n", "application/x-ndjson")
+            final = json.loads(body.decode().strip().splitlines()[-1])
+            if status != 200 or not final.get("done"):
+                raise RuntimeError(f"Ingest failed: {final}")
+            batch = []
+    return time.perf_counter() - started
+
+
+def run_scenario(client, bodies, clients):
+    """Latency percentiles (ms), throughput and errors for POSTing ``bodies`` to /recommend."""
+    def call(body):
+        started = time.perf_counter()
+        status, _ = client.post("/recommend", body)
+        return time.perf_counter() - started, status
+
+    reset_peak_memory(client.pid)
+    started = time.perf_counter()
+    if clients == 1:
+        results = [call(body) for body in bodies]
+    else:
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            results = list(pool.map(call, bodies))
+    wall = time.perf_counter() - started
+    latencies = np.array([elapsed for elapsed, _ in results]) * 1000.0
+    rss, peak = memory_mb(client.pid) if client.pid else (None, None)
+    return {
+        "requests": len(bodies),
+        "clients": clients,
+        "errors": sum(1 for _, status in results if status != 200),
+        "throughput_rps": len(bodies) / wall,
+        "latency_ms": {
+            "p50": float(np.percentile(latencies, 50)),
+            "p90": float(np.percentile(latencies, 90)),
+            "p99": float(np.percentile(latencies, 99)),
+            "mean": float(latencies.mean()),
+            "max": float(latencies.max()),
+        },
+        "rss_mb": rss,
+        "peak_rss_mb": peak,
+    }
+
+
+def benchmark_size(client, n_events, args):
+    """Load ``n_events`` and run cold/warm x single/concurrent /recommend scenarios."""
+    ingest_seconds = load_catalogue(client, n_events, args.seed)
+    results = []
+    for clients in (1, args.concurrency):
+        # Cold: profiles never seen before (user memo and response cache misses); warm: the same again
+        bodies = [json.dumps(body) for body in synthetic_requests(args.requests, n_events, seed=args.seed + clients)]
+        for cache in ("cold", "warm"):
+            result = run_scenario(client, bodies, clients)
+            results.append({"events": n_events, "cache": cache, **result})
+            print(
+                f"{n_events:>7} events  {cache:<4}  {clients:>2} clients  "
+                f"p50 {result['latency_ms']['p50']:8.2f}ms  p99 {result['latency_ms']['p99']:8.2f}ms  "
+                f"{result['throughput_rps']:8.1f} req/s  peak {result['peak_rss_mb'] or 0:7.1f}MB",
+                file=sys.stderr,
+            )
+    return {
+        "events": n_events,
+        "ingest_seconds": ingest_seconds,
+        "ingest_events_per_second": n_events / ingest_seconds,
+        "scenarios": results,
+    }
+
+
+def run_isolated(n_events, args):
+    # Each in-process size runs in a fresh interpreter so peak RSS is not carried over
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--sizes", str(n_events),
+               "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--seed", str(args.seed)]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.stdout)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path, results):
+    # p50/p99 ratio (new / baseline) per matching scenario; < 1 is faster
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {
+        (s["events"], s["cache"], s["clients"]): s
+        for size in baseline["results"] for s in size["scenarios"]
+    }
+    for size in results:
+        for s in size["scenarios"]:
+            before = old.get((s["events"], s["cache"], s["clients"]))
+            if before is None:
+                continue
+            ratios = {q: s["latency_ms"][q] / before["latency_ms"][q] for q in ("p50", "p99")}
+            print(f"{s['events']:>7} events  {s['cache']:<4}  {s['clients']:>2} clients  "
+                  f"p50 x{ratios['p50']:.2f}  p99 x{ratios['p99']:.2f}  "
+                  f"throughput x{s['throughput_rps'] / before['throughput_rps']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /recommend on synthetic catalogues")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated catalogue sizes")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients in the concurrent scenarios")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Benchmark a running service instead of the app in-process")
+    parser.add_argument("--pid", help="With --url: service process id, to report its RSS")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    if args.worker:
+        json.dump(benchmark_size(InProcessClient(), sizes[0], args), sys.stdout)
+        return
+
+    if args.url:
+        client = HTTPClient(args.url, args.pid)
+        results = [benchmark_size(client, n, args) for n in sizes]
+    else:
+        results = [run_isolated(n, args) for n in sizes]
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "target": args.url or "in-process",
+        "settings": {key: os.environ[key] for key in KNOBS if key in os.environ},
+        "args": {"sizes": sizes, "requests": args.requests, "concurrency": args.concurrency, "seed": args.seed},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def text_digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Event embeddings keyed by (event_id, hash of the embedding text).
+
+    Entries live in a bounded in-memory LRU and, when ``disk_dir`` is set, in
+    a second on-disk tier of one ``.npy`` file per entry. Storing a new text
+    for an event drops the superseded entry, so edited events are re-embedded.
+    """
+
+    def __init__(self, max_entries=50000, disk_dir=None, max_disk_entries=500000, namespace=""):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.namespace = namespace
+        self._memory = OrderedDict()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk_count = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_count = sum(1 for entry in os.scandir(disk_dir) if entry.name.endswith(".npy"))
+
+    def _key(self, event_id, text):
+        return text_digest(f"{self.namespace}\0{event_id}\0{text}")
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".npy")
+
+    def get(self, event_id, text):
+        key = self._key(event_id, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        if self.disk_dir:
+            try:
+                vector = np.load(self._disk_path(key))
+            except (OSError, ValueError):
+                vector = None
+            if vector is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(event_id, key, vector)
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, event_id, text, vector):
+        key = self._key(event_id, text)
+        with self._lock:
+            previous = self._remember(event_id, key, vector)
+        if self.disk_dir:
+            self._write_disk(key, vector)
+            if previous:
+                self._remove_disk(previous)
+
+    def get_many(self, items):
+        """Look up ``(event_id, text)`` pairs; returns vectors (or None) and the miss positions."""
+        vectors = [self.get(event_id, text) for event_id, text in items]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        return vectors, missing
+
+    def _remember(self, event_id, key, vector):
+        # Caller holds the lock. Returns the key this one superseded, if any.
+        previous = self._latest.get(event_id)
+        if previous == key:
+            previous = None
+        elif previous is not None:
+            self._memory.pop(previous, None)
+        self._latest[event_id] = key
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+        if len(self._latest) > 2 * self.max_entries:
+            live = set(self._memory)
+            self._latest = {eid: k for eid, k in self._latest.items() if k in live}
+        return previous
+
+    def _write_disk(self, key, vector):
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, vector)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write embedding cache entry: {e}")
+            return
+        with self._lock:
+            self._disk_count += 1
+            over = self._disk_count > self.max_disk_entries
+        if over:
+            self._evict_disk()
+
+    def _remove_disk(self, key):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            return
+        with self._lock:
+            self._disk_count -= 1
+
+    def _evict_disk(self):
+        # Drop the least recently written tenth of the disk tier
+        entries = [e for e in os.scandir(self.disk_dir) if e.name.endswith(".npy")]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        target = int(self.max_disk_entries * 0.9)
+        removed = 0
+        for entry in entries[:max(len(entries) - target, 0)]:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_count = len(entries) - removed
+            self.evictions += removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_entries": self._disk_count if self.disk_dir else 0,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+def normalize_keywords(keywords):
+    # Order-insensitive, case-normalised form of a user's interests + skills
+    return " ".join(sorted({str(k).strip().lower() for k in keywords if str(k).strip()}))
+
+
+class TTLCache:
+    """In-memory LRU whose entries also expire ``ttl`` seconds after being stored."""
+
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._memory[key] = (value, time.monotonic() + self.ttl)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class UserEmbeddingMemo(TTLCache):
+    """User vectors keyed on the normalised interest/skill set, with TTL and LRU eviction."""
@@ -0,0 +1,151 @@
+import argparse
+import json
+
+import numpy as np
+
+DTYPES = ("float32", "float16", "int8")
+
+# Rows widened to float32 at a time when scoring a compact store
+SCORE_BLOCK = 16384
+
+
+class EmbeddingStore:
+    """One contiguous embedding matrix stored as float32, float16 or per-row-scaled int8.
+
+    Similarities are computed block by block straight from the stored codes;
+    for int8 the per-row scale is applied to the dot products rather than to
+    the matrix, so nothing is ever fully dequantised.
+    """
+
+    def __init__(self, dim, capacity, dtype="float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {', '.join(DTYPES)}")
+        self.dim = dim
+        self.dtype = dtype
+        self.data = np.zeros((capacity, dim), dtype=dtype)
+        self.scales = np.ones(capacity, dtype=np.float32) if dtype == "int8" else None
+
+    @classmethod
+    def from_arrays(cls, data, scales=None):
+        """Wrap existing arrays (e.g. memory-mapped snapshot files) without copying."""
+        store = cls.__new__(cls)
+        store.dim = data.shape[1]
+        store.dtype = data.dtype.name
+        store.data = data
+        store.scales = scales
+        return store
+
+    @property
+    def capacity(self):
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def reserve(self, capacity, size):
+        if capacity <= self.capacity:
+            return
+        data = np.zeros((capacity, self.dim), dtype=self.dtype)
+        data[:size] = self.data[:size]
+        self.data = data
+        if self.scales is not None:
+            scales = np.ones(capacity, dtype=np.float32)
+            scales[:size] = self.scales[:size]
+            self.scales = scales
+
+    def set(self, rows, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dtype != "int8":
+            self.data[rows] = vectors
+            return
+        scales = np.abs(vectors).max(axis=-1) / 127.0
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        self.data[rows] = np.rint(vectors / scales[..., None]).astype(np.int8)
+        self.scales[rows] = scales
+
+    def move(self, src, dst):
+        self.data[dst] = self.data[src]
+        if self.scales is not None:
+            self.scales[dst] = self.scales[src]
+
+    def get(self, rows):
+        """Float32 copy of ``rows`` (dequantised for compact stores)."""
+        vectors = self.data[rows].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][..., None]
+        return vectors
+
+    def dot(self, queries, size=None, rows=None):
+        """``queries`` (one vector or a matrix) against ``data[:size]`` or the given ``rows``.
+
+        Returns one score per row for a single query, else a queries x rows matrix.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+        if rows is None:
+            codes = self.data[:size]
+            scales = self.scales[:size] if self.scales is not None else None
+        else:
+            codes = self.data[rows]
+            scales = self.scales[rows] if self.scales is not None else None
+
+        if self.dtype == "float32":
+            scores = codes @ queries.T
+        else:
+            scores = np.empty((len(codes), len(queries)), dtype=np.float32)
+            for start in range(0, len(codes), SCORE_BLOCK):
+                block = codes[start:start + SCORE_BLOCK].astype(np.float32) @ queries.T
+                if scales is not None:
+                    block *= scales[start:start + SCORE_BLOCK, None]
+                scores[start:start + SCORE_BLOCK] = block
+        return scores[:, 0] if single else scores.T
+
+
+def recall_at_k(baseline, dtype, queries, k=10):
+    """Mean overlap between float32 top-k and ``dtype`` top-k for each query."""
+    store = EmbeddingStore(baseline.shape[1], len(baseline), dtype)
+    store.set(slice(0, len(baseline)), baseline)
+    exact = queries @ baseline.T
+    approx = store.dot(queries, len(baseline))
+    k = min(k, len(baseline))
+    overlap = []
+    for e, a in zip(exact, approx):
+        top_exact = set(np.argpartition(-e, k - 1)[:k])
+        top_approx = set(np.argpartition(-a, k - 1)[:k])
+        overlap.append(len(top_exact & top_approx) / k)
+    return float(np.mean(overlap))
+
+
+def main():
+    # Recall and memory of each storage dtype against float32, on real catalogue embeddings
+    parser = argparse.ArgumentParser(description="Compare compact embedding storage against float32")
+    parser.add_argument("events", help="JSON file holding a list of events")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    from app import build_event_text, encode_texts
+
+    with open(args.events) as f:
+        events = json.load(f)
+    baseline = encode_texts([build_event_text(event) for event in events])
+    rng = np.random.default_rng(0)
+    picked = rng.choice(len(baseline), min(args.queries, len(baseline)), replace=False)
+    # Perturbed event vectors stand in for user profiles
+    queries = baseline[picked] + rng.normal(scale=0.05, size=(len(picked), baseline.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    for dtype in DTYPES:
+        store = EmbeddingStore(baseline.shape[1], len(baseline), dtype)
+        print(json.dumps({
+            "dtype": dtype,
+            "recall_at_k": recall_at_k(baseline, dtype, queries, args.k),
+            "k": args.k,
+            "megabytes": round(store.nbytes / 2**20, 2),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,633 @@
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from embedding_cache import text_digest
+from embedding_store import EmbeddingStore
+from metrics import StageStats
+import snapshots
+from ranking import rank
+from temporal_index import TemporalIndex
+
+# Rows reserved up front; the matrix doubles whenever it fills up
+INITIAL_CAPACITY = 1024
+
+# Event fields kept next to each embedding row for filtering
+METADATA_FIELDS = ("name", "category", "location", "targetAudience", "tags", "date")
+
+# Fields filtered by value; each row holds a small integer code per field (0: missing)
+CODED_FIELDS = ("category",)
+
+# Empty rows written after the live ones in a snapshot (as a fraction of them, at least
+# SPARE_ROWS), so a memory-mapped load takes new events without copying the matrix
+SPARE_FRACTION = 0.125
+SPARE_ROWS = 64
+
+NO_DATE = np.iinfo(np.int64).max
+
+logger = logging.getLogger(__name__)
+
+
+def parse_event_date(value):
+    # Epoch seconds; naive timestamps are taken as UTC, unparseable ones as undated
+    if not value:
+        return NO_DATE
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return NO_DATE
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def value_code(codes, value):
+    # Code of a filter value in ``codes`` ({lower-cased value: code}), added if new; 0 when missing
+    key = str(value or "").strip().lower()
+    if not key:
+        return 0
+    return codes.setdefault(key, len(codes) + 1)
+
+
+def states_fingerprint(event_ids, states):
+    digest = hashlib.sha1()
+    for event_id, state in zip(event_ids, states):
+        digest.update(f"{event_id}={state}\n".encode())
+    return digest.hexdigest()
+
+
+class EventIndex:
+    """Event embeddings held in one contiguous matrix (an EmbeddingStore).
+
+    Row ``i`` of the store belongs to ``ids[i]``; deletes move the last row
+    into the freed slot so live rows always occupy the first ``size`` rows.
+    ``dtype`` picks float32, float16 or int8 storage for the embeddings.
+
+    With an ``ann`` (IVFIndex) the index switches from exact to approximate
+    search once it holds ``ann_min_size`` events; training happens in a
+    background thread and is redone whenever the catalogue doubles.
+
+    With a ``lexical`` index (LexicalIndex) and ``lexical_candidates`` set,
+    searches that pass the query text first take the top candidates by
+    sparse TF-IDF score and only re-rank those with the embeddings.
+
+    ``timeline`` (a TemporalIndex) keeps the rows ordered by start time for
+    window queries; ``expire`` drops events that have already started.
+
+    ``filter_fields`` names event fields, besides category, that searches can
+    match by value (``fields={"targetAudience": [...]}``).
+    """
+
+    def __init__(self, dim, capacity=INITIAL_CAPACITY, ann=None, ann_min_size=20000, dtype="float32",
+                 lexical=None, lexical_candidates=0, stages=None, filter_fields=()):
+        self.dim = dim
+        self.coded_fields = tuple(dict.fromkeys(CODED_FIELDS + tuple(filter_fields)))
+        self.metadata_fields = tuple(dict.fromkeys(METADATA_FIELDS + self.coded_fields))
+        self.store = EmbeddingStore(dim, capacity, dtype)
+        self.dates = np.full(capacity, NO_DATE, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.lists = np.full(capacity, -1, dtype=np.int32)
+        self.codes = {field: np.zeros(capacity, dtype=np.int32) for field in self.coded_fields}
+        # Lower-cased value -> code, per coded field
+        self.code_values = {field: {} for field in self.coded_fields}
+        self.ann = ann
+        self.ann_min_size = ann_min_size
+        self._ann_trained_size = 0
+        self._ann_training = False
+        self.slots = np.full(capacity, -1, dtype=np.int64)
+        self.lexical = lexical
+        self.lexical_candidates = lexical_candidates
+        self.stages = stages if stages is not None else StageStats()
+        self.timeline = TemporalIndex()
+        self.ids = []
+        self.digests = []
+        self.metadata = []
+        self.rows = {}
+        self.version = 0
+        # Snapshot version this index was last loaded from or saved as
+        self.snapshot = 0
+        # Last journal entry (see journal.py) applied to this index
+        self.journal = 0
+        self._lock = threading.RLock()
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    @property
+    def mapped(self):
+        """Whether the embeddings are still the memory-mapped snapshot file (shared with other processes)."""
+        return isinstance(self.store.data, np.memmap)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, event_id):
+        return event_id in self.rows
+
+    def _reserve(self, needed):
+        capacity = self.store.capacity
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity = max(2 * capacity, INITIAL_CAPACITY)
+        self.store.reserve(capacity, self.size)
+        dates = np.full(capacity, NO_DATE, dtype=np.int64)
+        dates[:self.size] = self.dates[:self.size]
+        active = np.zeros(capacity, dtype=bool)
+        active[:self.size] = self.active[:self.size]
+        lists = np.full(capacity, -1, dtype=np.int32)
+        lists[:self.size] = self.lists[:self.size]
+        slots = np.full(capacity, -1, dtype=np.int64)
+        slots[:self.size] = self.slots[:self.size]
+        self.dates, self.active, self.lists, self.slots = dates, active, lists, slots
+        codes = {}
+        for field, column in self.codes.items():
+            codes[field] = np.zeros(capacity, dtype=np.int32)
+            codes[field][:self.size] = column[:self.size]
+        self.codes = codes
+
+    def _set_codes(self, row, event):
+        for field, column in self.codes.items():
+            column[row] = value_code(self.code_values[field], event.get(field))
+
+    def upsert(self, events, texts, embed):
+        """Insert or update events; ``embed`` is only called for new or edited texts.
+
+        Returns the number of events that had to be (re-)embedded.
+        """
+        with self._lock:
+            ids = [str(event["event_id"]) for event in events]
+            digests = [text_digest(text) for text in texts]
+            stale = [
+                i for i, (event_id, digest) in enumerate(zip(ids, digests))
+                if event_id not in self.rows or self.digests[self.rows[event_id]] != digest
+            ]
+            vectors = embed([events[i] for i in stale]) if stale else None
+            fresh = dict(zip(stale, vectors)) if stale else {}
+            if stale and self.ann is not None and self.ann.trained:
+                fresh_lists = dict(zip(stale, self.ann.assign(vectors)))
+            else:
+                fresh_lists = {}
+            fresh_slots = {}
+            if stale and self.lexical is not None:
+                self.lexical.remove([self.slots[self.rows[ids[i]]] for i in stale if ids[i] in self.rows])
+                fresh_slots = dict(zip(stale, self.lexical.add([texts[i] for i in stale])))
+
+            self._reserve(self.size + len({event_id for event_id in ids if event_id not in self.rows}))
+            # Date of each touched row before this upsert (None for new rows)
+            previous_dates = {}
+            for i, (event, event_id, digest) in enumerate(zip(events, ids, digests)):
+                row = self.rows.get(event_id)
+                if row is not None:
+                    previous_dates.setdefault(row, self.dates[row])
+                else:
+                    row = self.size
+                    previous_dates[row] = None
+                    self.rows[event_id] = row
+                    self.ids.append(event_id)
+                    self.digests.append(digest)
+                    self.metadata.append(None)
+                if i in fresh:
+                    self.store.set(row, fresh[i])
+                    self.lists[row] = fresh_lists.get(i, -1)
+                    self.slots[row] = fresh_slots.get(i, -1)
+                    self.digests[row] = digest
+                self.metadata[row] = {field: event.get(field) for field in self.metadata_fields}
+                self._set_codes(row, event)
+                self.dates[row] = parse_event_date(event.get("date"))
+                self.active[row] = bool(event.get("isActive", True))
+            retimed = [(row, date) for row, date in previous_dates.items() if date != self.dates[row]]
+            self._retime(
+                [(date, row) for row, date in retimed if date is not None],
+                [(self.dates[row], row) for row, _ in retimed],
+            )
+            self.version += 1
+            self._maybe_train_ann()
+            self._maybe_compact_lexical()
+            return len(stale)
+
+    def delete(self, event_ids):
+        with self._lock:
+            removed = 0
+            # Net timeline change of the whole batch, applied in one pass at the end:
+            # +1 for a (date, row) pair to insert, -1 for one to remove
+            retimed = {}
+            dead_slots = []
+
+            def shift(pair, change):
+                retimed[pair] = retimed.get(pair, 0) + change
+
+            for event_id in event_ids:
+                row = self.rows.pop(str(event_id), None)
+                if row is None:
+                    continue
+                dead_slots.append(self.slots[row])
+                last = self.size - 1
+                shift((self.dates[row], row), -1)
+                if row != last:
+                    shift((self.dates[last], last), -1)
+                    shift((self.dates[last], row), 1)
+                    moved_id = self.ids[last]
+                    self.store.move(last, row)
+                    self.dates[row] = self.dates[last]
+                    self.active[row] = self.active[last]
+                    self.lists[row] = self.lists[last]
+                    self.slots[row] = self.slots[last]
+                    for column in self.codes.values():
+                        column[row] = column[last]
+                    self.ids[row] = moved_id
+                    self.digests[row] = self.digests[last]
+                    self.metadata[row] = self.metadata[last]
+                    self.rows[moved_id] = row
+                self.ids.pop()
+                self.digests.pop()
+                self.metadata.pop()
+                self.active[last] = False
+                self.dates[last] = NO_DATE
+                self.lists[last] = -1
+                self.slots[last] = -1
+                for column in self.codes.values():
+                    column[last] = 0
+                removed += 1
+            if removed:
+                if len(retimed) > self.size // 8:
+                    # Sorting the remaining rows once beats locating this many pairs one by one
+                    self.timeline.build(self.dates[:self.size])
+                else:
+                    self._retime(
+                        [pair for pair, change in retimed.items() if change < 0],
+                        [pair for pair, change in retimed.items() if change > 0],
+                    )
+                if self.lexical is not None:
+                    self.lexical.remove(dead_slots)
+                self.version += 1
+                self._maybe_compact_lexical()
+            return removed
+
+    def set_active(self, event_ids, active):
+        with self._lock:
+            changed = 0
+            for event_id in event_ids:
+                row = self.rows.get(str(event_id))
+                if row is not None and self.active[row] != active:
+                    self.active[row] = active
+                    changed += 1
+            if changed:
+                self.version += 1
+            return changed
+
+    def _retime(self, removed, added):
+        # Caller holds the lock
+        if removed:
+            self.timeline.remove(*zip(*removed))
+        if added:
+            self.timeline.insert(*zip(*added))
+
+    def expired(self, now=None):
+        """Number of events that have already started (O(log n))."""
+        now = int(time.time()) if now is None else now
+        return self.timeline.count_until(now)
+
+    def expire(self, now=None):
+        """Delete events that have already started; returns their ids."""
+        with self._lock:
+            now = int(time.time()) if now is None else now
+            rows = self.timeline.window(end=now)
+            event_ids = [self.ids[row] for row in rows]
+            self.delete(event_ids)
+            return event_ids
+
+    def candidate_mask(self, categories=None, exclude_ids=None, now=None, base=None, window=None, fields=None):
+        """Rows that are active, upcoming and pass the optional filters.
+
+        ``window`` is a ``(start, end)`` pair of epoch seconds (either may be
+        None) that further restricts event start times. ``fields`` maps filter
+        fields to the values (a value or a list) they must equal.
+        """
+        n = self.size
+        if base is None:
+            now = int(time.time()) if now is None else now
+            mask = self.active[:n] & (self.dates[:n] > now)
+        else:
+            mask = base.copy()
+        if window is not None:
+            in_window = np.zeros(n, dtype=bool)
+            in_window[self.timeline.window(*window)] = True
+            mask &= in_window
+        if categories:
+            mask &= self._field_mask("category", categories, n)
+        for field, values in (fields or {}).items():
+            if values is not None:
+                mask &= self._field_mask(field, [values] if isinstance(values, str) else values, n)
+        for event_id in exclude_ids or ():
+            row = self.rows.get(str(event_id))
+            if row is not None:
+                mask[row] = False
+        return mask
+
+    def _field_mask(self, field, values, n):
+        """Rows whose ``field`` equals one of ``values`` (case-insensitive), as one vectorised comparison."""
+        known = self.code_values[field]
+        keys = {str(value or "").strip().lower() for value in values}
+        # Code 0 is a missing value, which an empty one matches
+        codes = [0 if not key else known[key] for key in keys if not key or key in known]
+        return np.isin(self.codes[field][:n], codes)
+
+    def upcoming(self, event_ids, now=None):
+        """The ``event_ids`` that are indexed, active and have not started yet."""
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            rows = [(event_id, self.rows.get(str(event_id))) for event_id in event_ids]
+            return [
+                event_id for event_id, row in rows
+                if row is not None and self.active[row] and self.dates[row] > now
+            ]
+
+    def categories(self, event_ids):
+        """``{event_id: category}`` for the indexed ones among ``event_ids``."""
+        with self._lock:
+            return {
+                event_id: (self.metadata[self.rows[event_id]] or {}).get("category")
+                for event_id in map(str, event_ids) if event_id in self.rows
+            }
+
+    def states(self, event_ids):
+        """Text digest and date of each of ``event_ids`` ("-" when not indexed)."""
+        with self._lock:
+            rows = [self.rows.get(str(event_id)) for event_id in event_ids]
+            return [f"{self.digests[row]}:{self.dates[row]}" if row is not None else "-" for row in rows]
+
+    def fingerprint(self, event_ids):
+        """Hex digest of the ids, texts and dates of ``event_ids``.
+
+        Equal on every worker for the same catalogue content, unlike ``version``.
+        """
+        return states_fingerprint(event_ids, self.states(event_ids))
+
+    def _maybe_train_ann(self):
+        # Caller holds the lock
+        if self.ann is None or self._ann_training or self.size < self.ann_min_size:
+            return
+        if self.ann.trained and self.size < 2 * self._ann_trained_size:
+            return
+        self._ann_training = True
+        threading.Thread(target=self._train_ann, name="ivf-train", daemon=True).start()
+
+    def _train_ann(self):
+        try:
+            with self._lock:
+                n = self.size
+                picked = np.random.default_rng().choice(n, min(n, self.ann.sample_size), replace=False)
+                sample = self.store.get(np.sort(picked))
+            centroids = self.ann.train(sample)
+            with self._lock:
+                self.ann.centroids = centroids
+                for start in range(0, self.size, 8192):
+                    end = min(start + 8192, self.size)
+                    self.lists[start:end] = self.ann.assign(self.store.get(slice(start, end)))
+                self._ann_trained_size = self.size
+        except Exception as e:
+            logger.error(f"IVF training failed: {e}")
+        finally:
+            self._ann_training = False
+
+    def _maybe_compact_lexical(self):
+        # Caller holds the lock. Edits and deletes leave tombstoned slots behind.
+        if self.lexical is None or self.lexical.n_slots < 1024 or self.lexical.dead_ratio < 0.5:
+            return
+        mapping = self.lexical.compact()
+        slots = self.slots[:self.size]
+        slots[slots >= 0] = mapping[slots[slots >= 0]]
+
+    def _lexical_rows(self, query_text, mask):
+        """Top ``lexical_candidates`` rows by TF-IDF score, plus rows without a lexical slot."""
+        n = self.size
+        slots = self.slots[:n]
+        scores = self.lexical.scores(query_text)
+        row_scores = np.where(slots >= 0, scores[np.maximum(slots, 0)], 0.0)
+        matched = np.flatnonzero(mask & (row_scores > 0))
+        if len(matched) > self.lexical_candidates:
+            best = np.argpartition(-row_scores[matched], self.lexical_candidates - 1)[:self.lexical_candidates]
+            matched = matched[best]
+        if not len(matched):
+            return None
+        unindexed = np.flatnonzero(mask & (slots < 0))
+        return np.union1d(matched, unindexed)
+
+    def _boost_column(self, boosts):
+        """Dense per-row array of ``boosts`` ({event_id: score}); rows not listed get 0."""
+        column = np.zeros(self.size, dtype=np.float32)
+        for event_id, score in (boosts or {}).items():
+            row = self.rows.get(str(event_id))
+            if row is not None:
+                column[row] = score
+        return column
+
+    @property
+    def uses_ann(self):
+        return self.ann is not None and self.ann.trained and self.size >= self.ann_min_size
+
+    def search(self, user_embedding, threshold, categories=None, exclude_ids=None, top_k=None, sort_by="date",
+               query_text=None, boosts=None, window=None, scored=False, fields=None):
+        """Ids of candidate events with similarity >= threshold, in ``sort_by`` order.
+
+        ``boosts`` ({event_id: score}) is added to the similarities first;
+        boosted rows are always scored, whichever stage picks the candidates.
+        With a ``window`` only the events starting inside it are scored.
+        ``scored`` returns ``(event_id, similarity, date)`` triples instead.
+        """
+        with self._lock:
+            n = self.size
+            if n == 0:
+                return []
+            with self.stages.time("filter"):
+                mask = self.candidate_mask(categories, exclude_ids, window=window, fields=fields)
+            boost = self._boost_column(boosts) if boosts else None
+
+            # Candidate rows: lexical matches, probed IVF lists or the window; None scores every row
+            rows, path = None, "dense"
+            if (self.lexical is not None and self.lexical_candidates and query_text
+                    and mask.sum() > self.lexical_candidates):
+                with self.stages.time("lexical"):
+                    rows = self._lexical_rows(query_text, mask)
+                path = "lexical"
+            if rows is None and self.uses_ann:
+                with self.stages.time("ann_probe"):
+                    rows = np.flatnonzero(mask & self.ann.probe(user_embedding)[self.lists[:n]])
+                path = "ann"
+            if rows is None and window is not None:
+                rows, path = np.flatnonzero(mask), "window"
+            if rows is None:
+                path = "dense"
+            elif boost is not None:
+                rows = np.union1d(rows, np.flatnonzero(mask & (boost != 0)))
+            self.stages.increment("searches_total", path=path)
+
+            with self.stages.time("similarity"):
+                if rows is None:
+                    similarities = self.store.dot(user_embedding, n)
+                else:
+                    similarities = self.store.dot(user_embedding, rows=rows)
+                if boost is not None:
+                    similarities += boost if rows is None else boost[rows]
+            with self.stages.time("rank"):
+                if rows is None:
+                    ranked = rank(similarities, self.dates[:n], mask, threshold, top_k, sort_by)
+                    return self._results(ranked, similarities[ranked], scored)
+                ranked = rank(similarities, self.dates[rows], None, threshold, top_k, sort_by)
+                return self._results(rows[ranked], similarities[ranked], scored)
+
+    def _results(self, rows, similarities, scored):
+        # Caller holds the lock
+        if not scored:
+            return [self.ids[row] for row in rows]
+        return [
+            (self.ids[row], float(similarity), int(self.dates[row]))
+            for row, similarity in zip(rows.tolist(), similarities.tolist())
+        ]
+
+    def search_batch(self, user_embeddings, threshold, filters=None, top_k=None, sort_by="date", boosts=None,
+                     scored=False):
+        """``search`` for many users at once, scored with one user x event product.
+
+        ``filters`` holds one ``(categories, exclude_ids, window, fields)`` tuple per user and
+        ``boosts`` one ``{event_id: score}`` dict (or None) per user.
+        """
+        with self._lock:
+            n = self.size
+            if n == 0:
+                return [[] for _ in range(len(user_embeddings))]
+            base = self.candidate_mask()
+            with self.stages.time("similarity"):
+                similarities = self.store.dot(user_embeddings, n)
+            dates = self.dates[:n]
+            results = []
+            for u in range(len(user_embeddings)):
+                categories, exclude_ids, window, fields = filters[u] if filters else (None, None, None, None)
+                mask = base
+                if categories or exclude_ids or window is not None or fields:
+                    mask = self.candidate_mask(categories, exclude_ids, base=base, window=window, fields=fields)
+                scores = similarities[u]
+                if boosts and boosts[u]:
+                    scores = scores + self._boost_column(boosts[u])
+                with self.stages.time("rank"):
+                    rows = rank(scores, dates, mask, threshold, top_k, sort_by)
+                results.append(self._results(rows, scores[rows], scored))
+            return results
+
+    def save_snapshot(self, directory, keep=3, model=None):
+        """Publish the live rows as a new versioned snapshot under ``directory``."""
+        with self._lock:
+            n = self.size
+            arrays = {
+                "embeddings": self.store.data[:n],
+                "dates": self.dates[:n],
+                "active": self.active[:n],
+                "lists": self.lists[:n],
+                "ids": np.array(self.ids, dtype=str),
+                "digests": np.array(self.digests, dtype="S40"),
+            }
+            if self.store.scales is not None:
+                arrays["scales"] = self.store.scales[:n]
+            if self.ann is not None and self.ann.trained:
+                arrays["centroids"] = self.ann.centroids
+            if self.lexical is not None:
+                arrays["slots"] = self.slots[:n]
+                arrays.update(self.lexical.to_arrays())
+            manifest = {
+                "size": n, "dim": self.dim, "dtype": self.store.dtype, "model": model,
+                "index_version": self.version, "journal": self.journal,
+            }
+            spare = max(SPARE_ROWS, int(n * SPARE_FRACTION))
+            self.snapshot = snapshots.write(
+                directory, arrays, manifest, {"metadata": self.metadata}, keep,
+                spare={"embeddings": spare, "scales": spare},
+            )
+            return self.snapshot
+
+    def load_snapshot(self, directory, model=None):
+        """Load the published snapshot, memory-mapped when its dtype matches this index.
+
+        The new columns are built before the lock is taken, so searches only
+        wait for the swap. Returns the number of events restored (0 when
+        there is nothing usable).
+        """
+        path = snapshots.current_path(directory)
+        if path is None:
+            return 0
+        manifest = snapshots.read_manifest(path)
+        if manifest.get("dim") != self.dim or (model and manifest.get("model") not in (None, model)):
+            logger.warning(f"Ignoring snapshot {path}: built for {manifest.get('model')} ({manifest.get('dim')}-d)")
+            return 0
+        _, arrays, documents = snapshots.read(path, mmap=manifest["dtype"] == self.store.dtype)
+
+        n = manifest["size"]
+        if manifest["dtype"] == self.store.dtype:
+            store = EmbeddingStore.from_arrays(arrays["embeddings"], arrays.get("scales"))
+        else:
+            store = EmbeddingStore(self.dim, max(INITIAL_CAPACITY, n), self.store.dtype)
+            embeddings = np.asarray(arrays["embeddings"][:n], dtype=np.float32)
+            if "scales" in arrays:
+                embeddings = embeddings * arrays["scales"][:n, None]
+            store.set(slice(0, n), embeddings)
+
+        # Columns are tiny next to the embeddings; copy them so they can grow
+        capacity = store.capacity
+        dates = np.full(capacity, NO_DATE, dtype=np.int64)
+        dates[:n] = arrays["dates"]
+        active = np.zeros(capacity, dtype=bool)
+        active[:n] = arrays["active"]
+        lists = np.full(capacity, -1, dtype=np.int32)
+        slots = np.full(capacity, -1, dtype=np.int64)
+        ids = [str(event_id) for event_id in arrays["ids"]]
+        rows = {event_id: row for row, event_id in enumerate(ids)}
+        digests = [digest.decode() for digest in arrays["digests"]]
+        timeline = TemporalIndex()
+        timeline.build(dates[:n])
+        metadata = documents["metadata"]
+        codes = {field: np.zeros(capacity, dtype=np.int32) for field in self.coded_fields}
+        code_values = {field: {} for field in self.coded_fields}
+        for row, meta in enumerate(metadata):
+            for field, column in codes.items():
+                column[row] = value_code(code_values[field], (meta or {}).get(field))
+
+        with self._lock:
+            self.store = store
+            self.dates, self.active, self.lists, self.slots = dates, active, lists, slots
+            if self.lexical is not None and "slots" in arrays:
+                self.slots[:n] = arrays["slots"]
+                self.lexical.load_arrays(arrays)
+            self.ids, self.rows, self.digests = ids, rows, digests
+            self.timeline = timeline
+            self.metadata = metadata
+            self.codes, self.code_values = codes, code_values
+            if self.ann is not None and "centroids" in arrays:
+                self.ann.centroids = np.array(arrays["centroids"])
+                self.lists[:n] = arrays["lists"]
+                self._ann_trained_size = n
+            self.version += 1
+            self.snapshot = manifest["snapshot"]
+            self.journal = manifest.get("journal", 0)
+            self._maybe_train_ann()
+        logger.info(f"Loaded snapshot {path} ({n} events)")
+        return n
+
+    def stats(self):
+        with self._lock:
+            n = self.size
+            return {
+                "size": n,
+                "active": int(self.active[:n].sum()),
+                "capacity": self.store.capacity,
+                "dtype": self.store.dtype,
+                "embedding_bytes": self.store.nbytes,
+                "version": self.version,
+                "search": "ann" if self.uses_ann else "exact",
+                "ann": self.ann.stats() if self.ann is not None else None,
+                "lexical": self.lexical.stats() if self.lexical is not None else None,
+            }
@@ -0,0 +1,38 @@
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported once in the master (preload_app) with the model loaded
+# and warmed eagerly, so every forked worker shares the weights copy-on-write.
+# Workers share the event index through memory-mapped snapshots in
+# INDEX_SNAPSHOT_DIR (on tmpfs by default): an update takes a file lock and
+# appends one entry to the journal there, which the other workers replay on
+# their next request. Full reloads happen on each worker's sync thread, e.g. to
+# map the snapshot that the master folds the journal into every
+# SNAPSHOT_INTERVAL seconds. Background threads started at import (the
+# snapshots and the past-event expiry sweep) run in the master only. The master
+# serves no requests, so it catches up with the journal before each pass.
+import multiprocessing
+import os
+
+workers = int(os.environ.get("WEB_WORKERS", max(1, multiprocessing.cpu_count() // 2)))
+threads = int(os.environ.get("WEB_THREADS", 8))
+worker_class = "gthread"
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+timeout = 60
+preload_app = True
+
+# Split the cores between workers so their torch thread pools do not oversubscribe the CPU
+torch_threads = int(os.environ.get("TORCH_THREADS_PER_WORKER", max(1, multiprocessing.cpu_count() // workers)))
+
+os.environ.setdefault("STARTUP_MODE", "eager")
+os.environ.setdefault("INDEX_SNAPSHOT_DIR", "/dev/shm/iomp-event-index")
+os.environ.setdefault("SHARED_INDEX", "1")
+# Also bounds the journal: each snapshot lets the entries before the previous one go
+os.environ.setdefault("SNAPSHOT_INTERVAL", "30")
+# Warm-up in the master runs single-threaded; each worker sets its own count after fork
+os.environ.setdefault("TORCH_NUM_THREADS", "1")
+
+
+def post_fork(server, worker):
+    from app import init_worker
+
+    init_worker(torch_threads)
@@ -0,0 +1,193 @@
+import logging
+import threading
+
+import numpy as np
+from scipy import sparse
+
+import snapshots
+
+logger = logging.getLogger(__name__)
+
+# Entries of the co-registration matrix closer to zero than this are dropped after an update
+PRUNE_EPSILON = 1e-9
+
+
+def interaction_weight(rating=None, active=True):
+    # A plain registration counts 1; a rating scales it so 3 stars is neutral
+    if not active:
+        return 0.0
+    if rating is None:
+        return 1.0
+    return float(rating) / 3.0
+
+
+class CoRegistrationModel:
+    """Item-item collaborative filter over a sparse user x event interaction matrix.
+
+    ``R`` holds one weighted entry per (user, event) registration and the
+    co-registration matrix ``C = R^T R`` is kept up to date incrementally:
+    an update to a set of users adds ``R_new^T R_new - R_old^T R_old`` over
+    just their rows. Item-item similarity is the cosine ``C_jk / sqrt(C_jj
+    C_kk)``, so scoring a user is one sparse vector x matrix product.
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.items = {}
+        self.item_ids = []
+        # One {event column: weight} dict per user row
+        self.rows = []
+        self.cooccurrence = sparse.csr_matrix((0, 0), dtype=np.float64)
+        self.version = 0
+        # Snapshot version this model was last loaded from or saved as
+        self.snapshot = 0
+        # Last shared journal entry (see journal.py) applied to this model
+        self.journal = 0
+        self._lock = threading.RLock()
+
+    @property
+    def size(self):
+        return sum(len(row) for row in self.rows)
+
+    def __len__(self):
+        return self.size
+
+    def _column(self, event_id):
+        column = self.items.get(event_id)
+        if column is None:
+            column = self.items[event_id] = len(self.item_ids)
+            self.item_ids.append(event_id)
+        return column
+
+    def _matrix(self, rows):
+        data, indices, indptr = [], [], [0]
+        for row in rows:
+            indices.extend(row)
+            data.extend(row.values())
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), indptr),
+            shape=(len(rows), len(self.item_ids)),
+        )
+
+    def _resize(self, matrix):
+        n = len(self.item_ids)
+        if matrix.shape == (n, n):
+            return matrix
+        matrix = matrix.tocoo()
+        return sparse.csr_matrix((matrix.data, (matrix.row, matrix.col)), shape=(n, n))
+
+    def update(self, interactions):
+        """Apply ``(user_id, event_id, weight)`` triples; a weight of 0 removes the entry.
+
+        Returns the number of users whose rows changed.
+        """
+        with self._lock:
+            previous = {}
+            for user_id, event_id, weight in interactions:
+                user = self.users.get(user_id)
+                if user is None:
+                    if not weight:
+                        continue
+                    user = self.users[user_id] = len(self.rows)
+                    self.rows.append({})
+                column = self._column(event_id)
+                previous.setdefault(user, dict(self.rows[user]))
+                if weight:
+                    self.rows[user][column] = weight
+                else:
+                    self.rows[user].pop(column, None)
+
+            changed = [user for user, row in previous.items() if row != self.rows[user]]
+            if not changed:
+                return 0
+            old = self._matrix([previous[user] for user in changed])
+            new = self._matrix([self.rows[user] for user in changed])
+            cooccurrence = self._resize(self.cooccurrence) + (new.T @ new) - (old.T @ old)
+            cooccurrence.data[np.abs(cooccurrence.data) < PRUNE_EPSILON] = 0.0
+            cooccurrence.eliminate_zeros()
+            self.cooccurrence = cooccurrence.tocsr()
+            self.version += 1
+            return len(changed)
+
+    def scores(self, weights):
+        """Collaborative score per event id for a user with ``weights`` ({event_id: weight}).
+
+        Scores are the weighted mean cosine similarity to the user's own
+        events, which are themselves left out of the result.
+        """
+        with self._lock:
+            profile = {self.items[event_id]: weight for event_id, weight in weights.items()
+                       if event_id in self.items and weight}
+            total = sum(abs(weight) for weight in profile.values())
+            if not total:
+                return {}
+            diagonal = self.cooccurrence.diagonal()
+            inverse_norms = np.where(diagonal > 0, 1.0 / np.sqrt(np.maximum(diagonal, PRUNE_EPSILON)), 0.0)
+            columns = np.fromiter(profile, dtype=np.int64, count=len(profile))
+            values = np.fromiter(profile.values(), dtype=np.float64, count=len(profile))
+            query = sparse.csr_matrix(
+                (values * inverse_norms[columns], (np.zeros(len(columns), dtype=np.int64), columns)),
+                shape=(1, len(self.item_ids)),
+            )
+            related = (query @ self.cooccurrence).tocsr()
+            result = related.data * inverse_norms[related.indices] / total
+            return {
+                self.item_ids[column]: float(score)
+                for column, score in zip(related.indices, result)
+                if column not in profile and score > 0
+            }
+
+    def save_snapshot(self, directory, keep=3):
+        with self._lock:
+            interactions = self._matrix(self.rows)
+            user_ids = sorted(self.users, key=self.users.get)
+            arrays = {
+                "user_ids": np.array(user_ids, dtype=str),
+                "item_ids": np.array(self.item_ids, dtype=str),
+                "data": interactions.data,
+                "indices": interactions.indices,
+                "indptr": interactions.indptr,
+            }
+            manifest = {
+                "users": len(user_ids), "items": len(self.item_ids), "version": self.version, "journal": self.journal,
+            }
+            self.snapshot = snapshots.write(directory, arrays, manifest, keep=keep)
+            return self.snapshot
+
+    def load_snapshot(self, directory):
+        """Load the published interactions and rebuild ``C`` from them; returns the entry count."""
+        path = snapshots.current_path(directory)
+        if path is None:
+            return 0
+        manifest, arrays, _ = snapshots.read(path, mmap=False)
+        user_ids = [str(user_id) for user_id in arrays["user_ids"]]
+        item_ids = [str(item_id) for item_id in arrays["item_ids"]]
+        interactions = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(len(user_ids), len(item_ids)),
+        )
+        with self._lock:
+            self.users = {user_id: row for row, user_id in enumerate(user_ids)}
+            self.item_ids = item_ids
+            self.items = {item_id: column for column, item_id in enumerate(item_ids)}
+            self.rows = [
+                dict(zip(interactions.indices[start:end].tolist(), interactions.data[start:end].tolist()))
+                for start, end in zip(interactions.indptr[:-1], interactions.indptr[1:])
+            ]
+            self.cooccurrence = (interactions.T @ interactions).tocsr()
+            self.version += 1
+            self.snapshot = manifest["snapshot"]
+            self.journal = manifest.get("journal", 0)
+        logger.info(f"Loaded interactions snapshot {path} ({interactions.nnz} registrations)")
+        return interactions.nnz
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self.rows),
+                "events": len(self.item_ids),
+                "interactions": self.size,
+                "cooccurrence_nnz": int(self.cooccurrence.nnz),
+                "version": self.version,
+            }
@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+
+# Entries live in <snapshot directory>/journal; HEAD holds the number of the last one
+JOURNAL = "journal"
+HEAD = "HEAD"
+
+
+def _path(directory, *names):
+    return os.path.join(directory, JOURNAL, *names)
+
+
+def _entry_name(seq):
+    return f"e{seq:010d}.npz"
+
+
+def head(directory):
+    """Number of the last entry appended to the journal under ``directory`` (0 when empty)."""
+    try:
+        with open(_path(directory, HEAD)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def list_entries(directory):
+    try:
+        names = os.listdir(_path(directory))
+    except FileNotFoundError:
+        return []
+    return sorted(
+        int(name[1:-4]) for name in names
+        if name.startswith("e") and name.endswith(".npz") and name[1:-4].isdigit()
+    )
+
+
+def append(directory, change, arrays=None):
+    """Write ``change`` (a JSON document, plus optional arrays) as the next entry; returns its number.
+
+    The caller holds the snapshot lock of ``directory``. The entry is renamed
+    into place before HEAD moves on, so readers never see a partial one.
+    """
+    os.makedirs(_path(directory), exist_ok=True)
+    seq = head(directory) + 1
+    staging = _path(directory, f".{seq}.{os.getpid()}.tmp.npz")
+    np.savez(staging, change=np.array(json.dumps(change)), **(arrays or {}))
+    os.replace(staging, _path(directory, _entry_name(seq)))
+    pointer = _path(directory, f".{HEAD}.{os.getpid()}.tmp")
+    with open(pointer, "w") as f:
+        f.write(str(seq))
+    os.replace(pointer, _path(directory, HEAD))
+    return seq
+
+
+def read(directory, after):
+    """Entries numbered above ``after`` as ``(seq, change, arrays)``, oldest first.
+
+    None when some of them were already pruned: the reader has to load a
+    newer snapshot first.
+    """
+    entries = []
+    for seq in range(after + 1, head(directory) + 1):
+        try:
+            with np.load(_path(directory, _entry_name(seq))) as data:
+                change = json.loads(str(data["change"]))
+                arrays = {key: data[key] for key in data.files if key != "change"}
+        except FileNotFoundError:
+            return None
+        entries.append((seq, change, arrays))
+    return entries
+
+
+def prune(directory, upto):
+    """Delete the entries numbered ``upto`` or below, which a snapshot already holds."""
+    for seq in list_entries(directory):
+        if seq <= upto:
+            try:
+                os.remove(_path(directory, _entry_name(seq)))
+            except FileNotFoundError:
+                pass
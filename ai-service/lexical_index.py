@@ -0,0 +1,152 @@
+import threading
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Unmerged documents are folded into the postings once they reach this share of it
+MERGE_RATIO = 0.1
+MIN_MERGE = 1024
+
+
+class LexicalIndex:
+    """Incremental sparse TF-IDF index used as a cheap first retrieval stage.
+
+    The vocabulary is a fixed ``HashingVectorizer`` space, so nothing has to be
+    refitted when events change: document frequencies are kept as counters and
+    turned into IDF weights at query time. Documents get a slot each; merged
+    slots live in a term-major CSR matrix (an inverted index) so a query only
+    touches the postings of its own terms. New documents wait in a small
+    doc-major buffer until the next merge; removed slots are tombstoned.
+    """
+
+    def __init__(self, n_features=2 ** 18):
+        self.n_features = n_features
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            alternate_sign=False,
+            norm=None,
+            stop_words="english",
+        )
+        self.df = np.zeros(n_features, dtype=np.int32)
+        self.n_docs = 0
+        self.postings = sparse.csr_matrix((n_features, 0), dtype=np.float32)
+        self.pending = sparse.csr_matrix((0, n_features), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.terms = []
+        self._lock = threading.Lock()
+
+    @property
+    def n_slots(self):
+        return len(self.terms)
+
+    def _vectorize(self, texts):
+        # Sublinear, L2-normalised term frequencies; IDF is applied on the query side
+        tf = self.vectorizer.transform(texts).astype(np.float32)
+        tf.sum_duplicates()
+        tf.data = 1.0 + np.log(tf.data)
+        norms = np.sqrt(np.asarray(tf.multiply(tf).sum(axis=1)).ravel())
+        return sparse.diags(1.0 / np.maximum(norms, 1e-12)).dot(tf).tocsr()
+
+    def add(self, texts):
+        """Index ``texts``; returns their slot numbers."""
+        docs = self._vectorize(texts)
+        with self._lock:
+            start = self.n_slots
+            np.add.at(self.df, docs.indices, 1)
+            self.n_docs += docs.shape[0]
+            self.terms.extend(np.split(docs.indices.copy(), docs.indptr[1:-1]))
+            self.alive = np.concatenate([self.alive, np.ones(docs.shape[0], dtype=bool)])
+            self.pending = sparse.vstack([self.pending, docs], format="csr")
+            if self.pending.shape[0] >= max(MIN_MERGE, MERGE_RATIO * self.postings.shape[1]):
+                self._merge()
+            return np.arange(start, start + docs.shape[0])
+
+    def remove(self, slots):
+        with self._lock:
+            for slot in slots:
+                if slot < 0 or not self.alive[slot]:
+                    continue
+                self.alive[slot] = False
+                np.subtract.at(self.df, self.terms[slot], 1)
+                self.terms[slot] = self.terms[slot][:0]
+                self.n_docs -= 1
+
+    def _merge(self):
+        # Caller holds the lock
+        if not self.pending.shape[0]:
+            return
+        self.postings = sparse.hstack([self.postings, self.pending.T.tocsr()], format="csr")
+        self.pending = sparse.csr_matrix((0, self.n_features), dtype=np.float32)
+
+    def scores(self, query_text):
+        """Dense TF-IDF score per slot for ``query_text`` (0 for dead slots)."""
+        with self._lock:
+            query = self.vectorizer.transform([query_text])
+            query.sum_duplicates()
+            terms = query.indices
+            result = np.zeros(self.n_slots, dtype=np.float32)
+            if not len(terms) or not self.n_docs:
+                return result
+            idf = np.log((1.0 + self.n_docs) / (1.0 + self.df[terms])) + 1.0
+            weights = ((1.0 + np.log(query.data)) * idf * idf).astype(np.float32)
+
+            merged = self.postings.shape[1]
+            if merged:
+                result[:merged] = self.postings[terms].T.dot(weights)
+            if self.pending.shape[0]:
+                result[merged:] = self.pending[:, terms].dot(weights)
+            result[~self.alive] = 0.0
+            return result
+
+    @property
+    def dead_ratio(self):
+        return 1.0 - self.n_docs / self.n_slots if self.n_slots else 0.0
+
+    def compact(self):
+        """Drop tombstoned slots; returns an old-slot -> new-slot map (-1 for dropped)."""
+        with self._lock:
+            self._merge()
+            keep = np.flatnonzero(self.alive)
+            mapping = np.full(self.n_slots, -1, dtype=np.int64)
+            mapping[keep] = np.arange(len(keep))
+            self.postings = self.postings[:, keep].tocsr()
+            self.terms = [self.terms[slot] for slot in keep]
+            self.alive = np.ones(len(keep), dtype=bool)
+            return mapping
+
+    def to_arrays(self):
+        with self._lock:
+            self._merge()
+            postings = self.postings.tocsr()
+            return {
+                "lexical_data": postings.data,
+                "lexical_indices": postings.indices,
+                "lexical_indptr": postings.indptr,
+                "lexical_alive": self.alive,
+            }
+
+    def load_arrays(self, arrays):
+        with self._lock:
+            self.postings = sparse.csr_matrix(
+                (np.array(arrays["lexical_data"]), np.array(arrays["lexical_indices"]), np.array(arrays["lexical_indptr"])),
+                shape=(self.n_features, len(arrays["lexical_alive"])),
+            )
+            self.alive = np.array(arrays["lexical_alive"], dtype=bool)
+            # Per-document term lists and document frequencies come from the doc-major view
+            docs = self.postings.T.tocsr()
+            self.terms = np.split(docs.indices.copy(), docs.indptr[1:-1]) if docs.shape[0] else []
+            for slot in np.flatnonzero(~self.alive):
+                self.terms[slot] = self.terms[slot][:0]
+            live = docs[np.flatnonzero(self.alive)]
+            self.df = np.bincount(live.indices, minlength=self.n_features).astype(np.int32)
+            self.n_docs = live.shape[0]
+            self.pending = sparse.csr_matrix((0, self.n_features), dtype=np.float32)
+
+    def stats(self):
+        return {
+            "documents": self.n_docs,
+            "slots": self.n_slots,
+            "postings_nnz": int(self.postings.nnz),
+            "pending": self.pending.shape[0],
+        }
@@ -0,0 +1,94 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the per-stage latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StageStats:
+    """Latency histograms per named stage of request handling, plus labelled counters."""
+
+    def __init__(self):
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {"count": 0, "total": 0.0, "max": 0.0,
+                                               "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["buckets"][self._bucket(seconds)] += 1
+
+    @staticmethod
+    def _bucket(seconds):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                return i
+        return len(LATENCY_BUCKETS)
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def stats(self):
+        with self._lock:
+            return {
+                stage: {
+                    "count": entry["count"],
+                    "total_ms": entry["total"] * 1000.0,
+                    "mean_ms": entry["total"] * 1000.0 / entry["count"],
+                    "max_ms": entry["max"] * 1000.0,
+                }
+                for stage, entry in self._stages.items()
+            }
+
+    def prometheus(self, prefix):
+        """Stage histograms and counters in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                f"# HELP {prefix}_stage_seconds Time spent per request-handling stage",
+                f"# TYPE {prefix}_stage_seconds histogram",
+            ]
+            for stage, entry in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), entry["buckets"]):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {entry["total"]}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+            declared = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in declared:
+                    lines.append(f"# TYPE {prefix}_{name} counter")
+                    declared.add(name)
+                lines.append(f"{prefix}_{name}{format_labels(dict(labels))} {value}")
+            return lines
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def prometheus_gauges(prefix, name, help_text, samples, kind="gauge"):
+    """Exposition lines for one metric; ``samples`` is a list of ``(labels, value)`` pairs."""
+    lines = [f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{prefix}_{name}{format_labels(labels)} {float(value)}")
+    return lines
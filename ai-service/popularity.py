@@ -0,0 +1,243 @@
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+import snapshots
+
+logger = logging.getLogger(__name__)
+
+# exp(RENORMALIZE_EXPONENT) is the largest growth factor before scores are rebased
+RENORMALIZE_EXPONENT = 50.0
+INITIAL_CAPACITY = 1024
+
+
+class PopularityCounter:
+    """Time-decayed registration counts per event with a maintained top list per category.
+
+    Uses forward decay: a registration at time ``t`` adds ``exp(rate * (t -
+    origin))`` to its event's counter, so the decayed score at any later time
+    is the counter times one shared factor. Ordering therefore only changes
+    when registrations arrive, and the top lists are kept current by those
+    updates alone. Counters live in one float64 array indexed by slot.
+    """
+
+    def __init__(self, half_life_days=14.0, top_size=100):
+        self.rate = math.log(2) / (half_life_days * 86400.0)
+        self.top_size = top_size
+        self.origin = time.time()
+        self.scores = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self.codes = np.zeros(INITIAL_CAPACITY, dtype=np.int32)
+        self.slots = {}
+        self.event_ids = []
+        # Category code 0 is "uncategorised"; the global top list is keyed None
+        self.categories = {None: 0}
+        self.tops = {}
+        # (user_id, event_id) -> registration time, so repeated or cancelled registrations stay exact
+        self.registrations = {}
+        self.version = 0
+        # Snapshot version this counter was last loaded from or saved as
+        self.snapshot = 0
+        # Last shared journal entry (see journal.py) applied to this counter
+        self.journal = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.event_ids)
+
+    def _slot(self, event_id):
+        slot = self.slots.get(event_id)
+        if slot is None:
+            slot = self.slots[event_id] = len(self.event_ids)
+            self.event_ids.append(event_id)
+            if slot == len(self.scores):
+                self.scores = np.concatenate([self.scores, np.zeros(slot, dtype=np.float64)])
+                self.codes = np.concatenate([self.codes, np.zeros(slot, dtype=np.int32)])
+        return slot
+
+    def _code(self, category):
+        key = str(category).lower() if category else None
+        return self.categories.setdefault(key, len(self.categories))
+
+    def _weight(self, timestamp):
+        exponent = self.rate * (timestamp - self.origin)
+        if exponent > RENORMALIZE_EXPONENT:
+            # Rebase so the counters stay finite; every score shrinks by the same factor
+            self.scores *= math.exp(-exponent)
+            self.origin = timestamp
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def _promote(self, key, slot):
+        top = self.tops.setdefault(key, [])
+        if slot not in top:
+            if len(top) >= self.top_size and self.scores[slot] <= self.scores[top[-1]]:
+                return
+            top.append(slot)
+        top.sort(key=self.scores.__getitem__, reverse=True)
+        del top[self.top_size:]
+
+    def _rebuild(self, key):
+        n = len(self.event_ids)
+        if key is None:
+            slots = np.flatnonzero(self.scores[:n] > 0)
+        else:
+            slots = np.flatnonzero((self.codes[:n] == key) & (self.scores[:n] > 0))
+        if len(slots) > self.top_size:
+            slots = slots[np.argpartition(-self.scores[slots], self.top_size - 1)[:self.top_size]]
+        self.tops[key] = sorted(slots.tolist(), key=self.scores.__getitem__, reverse=True)
+
+    def _keys(self, slot):
+        return (None, int(self.codes[slot])) if self.codes[slot] else (None,)
+
+    def record(self, registrations, categories=None):
+        """Apply ``(user_id, event_id, timestamp, active)`` registrations.
+
+        ``categories`` ({event_id: category}) files new events under their
+        category. Returns the number of registrations that changed a count.
+        """
+        with self._lock:
+            changed = 0
+            lowered = set()
+            for user_id, event_id, timestamp, active in registrations:
+                key = (user_id, event_id)
+                if active == (key in self.registrations):
+                    continue
+                slot = self._slot(event_id)
+                if categories and not self.codes[slot] and categories.get(event_id):
+                    self.codes[slot] = self._code(categories[event_id])
+                if active:
+                    self.registrations[key] = timestamp
+                    self.scores[slot] += self._weight(timestamp)
+                    for top_key in self._keys(slot):
+                        self._promote(top_key, slot)
+                else:
+                    self.scores[slot] = max(0.0, self.scores[slot] - self._weight(self.registrations.pop(key)))
+                    lowered.update(self._keys(slot))
+                changed += 1
+            # A lowered member may have to make room for an event outside the list
+            for top_key in lowered:
+                self._rebuild(top_key)
+            if changed:
+                self.version += 1
+            return changed
+
+    def set_categories(self, categories):
+        """Move already counted events to their (possibly edited) ``categories``."""
+        with self._lock:
+            moved = set()
+            for event_id, category in categories.items():
+                slot = self.slots.get(event_id)
+                if slot is None:
+                    continue
+                code = self._code(category)
+                if code != self.codes[slot]:
+                    moved.update((int(self.codes[slot]), code))
+                    self.codes[slot] = code
+            for code in moved - {0}:
+                self._rebuild(code)
+            if moved:
+                self.version += 1
+
+    def remove(self, event_ids):
+        with self._lock:
+            removed = [self.slots[event_id] for event_id in event_ids if event_id in self.slots]
+            if not removed:
+                return 0
+            keys = {None}
+            for slot in removed:
+                keys.update(self._keys(slot))
+                self.scores[slot] = 0.0
+            gone = {self.event_ids[slot] for slot in removed}
+            self.registrations = {key: t for key, t in self.registrations.items() if key[1] not in gone}
+            for key in keys:
+                self._rebuild(key)
+            self.version += 1
+            return len(removed)
+
+    def top(self, k, category=None, eligible=None, now=None):
+        """Up to ``k`` ``(event_id, score)`` pairs, most popular first.
+
+        Walks the maintained list of ``category`` (all events when None);
+        ``eligible`` filters event ids, e.g. to upcoming events only.
+        """
+        with self._lock:
+            key = None
+            if category:
+                key = self.categories.get(str(category).lower())
+                if key is None:
+                    return []
+            now = time.time() if now is None else now
+            factor = math.exp(-self.rate * (now - self.origin))
+            top = self.tops.get(key, [])
+            ids = [self.event_ids[slot] for slot in top]
+            keep = set(eligible(ids) if eligible is not None else ids)
+            result = []
+            for slot, event_id in zip(top, ids):
+                if event_id in keep:
+                    result.append((event_id, float(self.scores[slot] * factor)))
+                    if len(result) == k:
+                        break
+            return result
+
+    def save_snapshot(self, directory, keep=3):
+        with self._lock:
+            n = len(self.event_ids)
+            names = sorted(self.categories, key=self.categories.get)
+            registrations = list(self.registrations.items())
+            arrays = {
+                "event_ids": np.array(self.event_ids, dtype=str),
+                "scores": self.scores[:n],
+                "codes": self.codes[:n],
+                "user_ids": np.array([user_id for (user_id, _), _ in registrations], dtype=str),
+                "registration_event_ids": np.array([event_id for (_, event_id), _ in registrations], dtype=str),
+                "registration_times": np.array([t for _, t in registrations], dtype=np.float64),
+            }
+            manifest = {
+                "origin": self.origin, "categories": names[1:], "version": self.version, "journal": self.journal,
+            }
+            self.snapshot = snapshots.write(directory, arrays, manifest, keep=keep)
+            return self.snapshot
+
+    def load_snapshot(self, directory):
+        path = snapshots.current_path(directory)
+        if path is None:
+            return 0
+        manifest, arrays, _ = snapshots.read(path, mmap=False)
+        with self._lock:
+            self.event_ids = [str(event_id) for event_id in arrays["event_ids"]]
+            self.slots = {event_id: slot for slot, event_id in enumerate(self.event_ids)}
+            n = len(self.event_ids)
+            capacity = max(INITIAL_CAPACITY, n)
+            self.scores = np.zeros(capacity, dtype=np.float64)
+            self.scores[:n] = arrays["scores"]
+            self.codes = np.zeros(capacity, dtype=np.int32)
+            self.codes[:n] = arrays["codes"]
+            self.origin = manifest["origin"]
+            self.categories = {None: 0, **{name: code for code, name in enumerate(manifest["categories"], 1)}}
+            self.registrations = {
+                (str(user_id), str(event_id)): float(t)
+                for user_id, event_id, t in zip(
+                    arrays["user_ids"], arrays["registration_event_ids"], arrays["registration_times"]
+                )
+            }
+            self.tops = {}
+            for key in self.categories.values():
+                self._rebuild(key or None)
+            self.version += 1
+            self.snapshot = manifest["snapshot"]
+            self.journal = manifest.get("journal", 0)
+        logger.info(f"Loaded popularity snapshot {path} ({n} events)")
+        return n
+
+    def stats(self):
+        with self._lock:
+            return {
+                "events": len(self.event_ids),
+                "registrations": len(self.registrations),
+                "categories": len(self.categories) - 1,
+                "half_life_days": math.log(2) / self.rate / 86400.0,
+                "version": self.version,
+            }
@@ -0,0 +1,71 @@
+import cProfile
+import logging
+import pstats
+import random
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    """Opt-in cProfile of single requests.
+
+    A request is profiled when it asks for it explicitly or is picked by
+    ``sample_rate``. A sampled profile is only kept when the request took
+    longer than ``slow_ms``. Kept reports (the ``top`` functions by
+    cumulative time) are logged and the last ``keep`` are held for
+    ``reports()``. Only one request is profiled at a time.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_ms=500.0, keep=20, top=20):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.top = top
+        self._reports = deque(maxlen=keep)
+        self._active = threading.Lock()
+
+    def start(self, explicit=False):
+        """A running profiler for this request, or None when it is not profiled."""
+        if not explicit and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.started = time.perf_counter()
+        profiler.explicit = explicit
+        profiler.enable()
+        return profiler
+
+    def finish(self, profiler, path):
+        profiler.disable()
+        self._active.release()
+        elapsed_ms = (time.perf_counter() - profiler.started) * 1000.0
+        if not profiler.explicit and elapsed_ms < self.slow_ms:
+            return None
+
+        stats = pstats.Stats(profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+        report = {
+            "path": path,
+            "elapsed_ms": elapsed_ms,
+            "explicit": profiler.explicit,
+            "at": time.time(),
+            "functions": [
+                {
+                    "function": f"{filename}:{line}({name})",
+                    "calls": calls,
+                    "total_ms": total * 1000.0,
+                    "cumulative_ms": cumulative * 1000.0,
+                }
+                for (filename, line, name), (_, calls, total, cumulative, _) in rows
+            ],
+        }
+        self._reports.append(report)
+        hot = "; ".join(f"{f['function']} {f['cumulative_ms']:.1f}ms" for f in report["functions"][:5])
+        logger.info(f"Profiled {path} ({elapsed_ms:.1f}ms): {hot}")
+        return report
+
+    def reports(self):
+        return list(self._reports)
@@ -0,0 +1,134 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_MODES = ("float32", "int8")
+
+
+def cache_path(cache_dir, model_name):
+    # Pickled modules are only safe to reload with the library versions that wrote them
+    import sentence_transformers
+
+    name = f"{model_name}-int8-torch{torch.__version__}-st{sentence_transformers.__version__}"
+    return os.path.join(cache_dir, name.replace("/", "_").replace("+", "_") + ".pt")
+
+
+def quantize(model):
+    """Copy of ``model`` with every ``nn.Linear`` dynamically quantized to int8.
+
+    Weights are stored as int8 and activations are quantized per batch at
+    run time, so no calibration data is needed. CPU only.
+    """
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            break
+    return torch.ao.quantization.quantize_dynamic(model.cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_quantized(model_name, cache_dir, load_float):
+    """The int8 model from ``cache_dir``, or ``quantize(load_float())`` cached there on a miss."""
+    path = cache_path(cache_dir, model_name) if cache_dir else None
+    if path and os.path.exists(path):
+        try:
+            started = time.perf_counter()
+            model = torch.load(path, map_location="cpu", weights_only=False)
+            logger.info(f"Loaded quantized {model_name} from {path} in {time.perf_counter() - started:.1f}s")
+            return model.eval()
+        except Exception as e:
+            logger.warning(f"Ignoring quantized model cache {path}: {e}")
+
+    started = time.perf_counter()
+    model = quantize(load_float())
+    logger.info(f"Quantized {model_name} to int8 in {time.perf_counter() - started:.1f}s")
+    if path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            partial = f"{path}.{os.getpid()}.tmp"
+            torch.save(model, partial)
+            os.replace(partial, path)
+        except OSError as e:
+            logger.warning(f"Could not cache quantized model in {cache_dir}: {e}")
+    return model
+
+
+def encode(model, texts, batch_size=64):
+    with torch.inference_mode():
+        return model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                            normalize_embeddings=True).astype(np.float32, copy=False)
+
+
+def ranking_agreement(reference, candidate, k=10):
+    """How closely ``candidate`` scores (queries x documents) rank like ``reference``."""
+    k = min(k, reference.shape[1])
+    reference_top = np.argsort(-reference, axis=1)[:, :k]
+    candidate_top = np.argsort(-candidate, axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(reference_top.tolist(), candidate_top.tolist())]
+    # Spearman correlation is the Pearson correlation of the rank vectors
+    reference_ranks = np.argsort(np.argsort(-reference, axis=1), axis=1).astype(np.float64)
+    candidate_ranks = np.argsort(np.argsort(-candidate, axis=1), axis=1).astype(np.float64)
+    spearman = [np.corrcoef(a, b)[0, 1] for a, b in zip(reference_ranks, candidate_ranks)]
+    return {
+        "k": k,
+        "top1_agreement": float(np.mean(reference_top[:, 0] == candidate_top[:, 0])),
+        "overlap_at_k": float(np.mean(overlap)),
+        "spearman": float(np.nanmean(spearman)),
+    }
+
+
+def parity_check(float_model, quantized_model, queries, documents, k=10, batch_size=64):
+    """Ranking agreement and encode throughput of the int8 model against float32 on a sample."""
+    report = {"queries": len(queries), "documents": len(documents)}
+    encoded = {}
+    for name, model in (("float32", float_model), ("int8", quantized_model)):
+        encode(model, documents[:batch_size], batch_size)  # warm-up
+        started = time.perf_counter()
+        encoded[name] = (encode(model, queries, batch_size), encode(model, documents, batch_size))
+        report[f"{name}_texts_per_second"] = (len(queries) + len(documents)) / (time.perf_counter() - started)
+    report["speedup"] = report["int8_texts_per_second"] / report["float32_texts_per_second"]
+    (float_queries, float_documents), (int8_queries, int8_documents) = encoded["float32"], encoded["int8"]
+    report["embedding_cosine"] = float(np.mean(np.sum(float_documents * int8_documents, axis=1)))
+    report.update(ranking_agreement(float_queries @ float_documents.T, int8_queries @ int8_documents.T, k))
+    return report
+
+
+def main():
+    # Parity of the int8 model against float32 on a catalogue (synthetic unless a JSON file is given)
+    parser = argparse.ArgumentParser(description="Compare the int8 quantized model against float32")
+    parser.add_argument("events", nargs="?", help="JSON file holding a list of events")
+    parser.add_argument("--events-sample", type=int, default=2000, help="Synthetic events when no file is given")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ.setdefault("STARTUP_MODE", "lazy")
+    from sentence_transformers import SentenceTransformer
+
+    from app import MODEL_NAME, build_event_text
+    from benchmark import synthetic_events, synthetic_requests
+    from embedding_cache import normalize_keywords
+
+    if args.events:
+        with open(args.events) as f:
+            events = json.load(f)
+    else:
+        events = list(synthetic_events(args.events_sample))
+    profiles = [request["user_profile"] for request in synthetic_requests(args.queries, len(events))]
+    queries = [normalize_keywords(p["interests"] + p["skills"]) for p in profiles]
+    documents = [build_event_text(event) for event in events]
+
+    float_model = SentenceTransformer(MODEL_NAME, device="cpu")
+    quantized_model = quantize(float_model)
+    print(json.dumps(parity_check(float_model, quantized_model, queries, documents, args.k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
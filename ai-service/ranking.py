@@ -0,0 +1,33 @@
+import numpy as np
+
+SORT_KEYS = ("date", "similarity")
+
+
+def rank(similarities, dates, mask=None, threshold=None, top_k=None, sort_by="date"):
+    """Positions of the events to recommend, in response order.
+
+    ``similarities`` and ``dates`` (int64 epoch seconds) are parallel arrays;
+    ``mask`` drops ineligible rows before anything else. With ``top_k`` only
+    the k most similar survive, selected with argpartition in O(n), and just
+    those k are sorted by ``sort_by``.
+    """
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"sort_by must be one of {', '.join(SORT_KEYS)}")
+
+    keep = np.ones(len(similarities), dtype=bool) if mask is None else mask.copy()
+    if threshold is not None:
+        keep &= similarities >= threshold
+    rows = np.flatnonzero(keep)
+
+    if top_k is not None and top_k < len(rows):
+        if top_k <= 0:
+            return rows[:0]
+        best = np.argpartition(-similarities[rows], top_k - 1)[:top_k]
+        rows = np.sort(rows[best])
+
+    # Stable sorts keep input order between ties, like the original list sort
+    if sort_by == "similarity":
+        order = np.argsort(-similarities[rows], kind="stable")
+    else:
+        order = np.argsort(dates[rows], kind="stable")
+    return rows[order]
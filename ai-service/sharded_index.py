@@ -0,0 +1,318 @@
+import hashlib
+import heapq
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+
+from event_index import states_fingerprint
+from metrics import StageStats
+import snapshots
+
+logger = logging.getLogger(__name__)
+
+
+def shard_name(value):
+    # Shard of an event field value (or of a value a query asks for); missing values share ""
+    return str(value or "").strip().lower()
+
+
+def merge(results, top_k=None, sort_by="date"):
+    """Merge per-shard ``(event_id, similarity, date)`` lists into one ranked id list.
+
+    Each list is already in ``sort_by`` order and holds at most its shard's
+    ``top_k`` most similar events, so the global top k are among them.
+    """
+    if sort_by == "similarity":
+        return [hit[0] for hit in islice(heapq.merge(*results, key=lambda hit: -hit[1]), top_k)]
+    if top_k is not None:
+        best = heapq.nlargest(max(top_k, 0), chain(*results), key=lambda hit: hit[1])
+        return [hit[0] for hit in sorted(best, key=lambda hit: hit[2])]
+    return [hit[0] for hit in heapq.merge(*results, key=lambda hit: hit[2])]
+
+
+class ShardedEventIndex:
+    """Events partitioned by one field into independent EventIndexes.
+
+    Each distinct value of ``key`` (e.g. ``targetAudience`` or ``category``,
+    compared lower-cased) gets its own shard built by ``make_shard``. A search
+    that filters on the key (``fields``, or its categories when the key is
+    ``category``) only visits the matching shards, which apply the same filter,
+    so sharding changes speed, not results. Shards are scored on a thread pool,
+    since the NumPy products release the GIL, and the per-shard top-k merged
+    with a heap.
+    Snapshots write only the shards that changed, plus a manifest naming the
+    version of every shard.
+    """
+
+    def __init__(self, key, make_shard, workers=None, stages=None):
+        self.key = key
+        self.make_shard = make_shard
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.stages = stages if stages is not None else StageStats()
+        self.shards = {}
+        # event_id -> shard name
+        self.shard_of = {}
+        self.version = 0
+        # Snapshot version this index was last loaded from or saved as
+        self.snapshot = 0
+        # Last journal entry (see journal.py) applied to this index
+        self.journal = 0
+        # Shard version at its last save or load, so unchanged shards are not rewritten
+        self._saved = {}
+        self._lock = threading.RLock()
+        self._pool = None
+        self._pid = None
+
+    @property
+    def size(self):
+        return sum(len(shard) for shard in list(self.shards.values()))
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, event_id):
+        return str(event_id) in self.shard_of
+
+    @property
+    def mapped(self):
+        return all(shard.mapped for shard in list(self.shards.values()))
+
+    @property
+    def ids(self):
+        return [event_id for shard in list(self.shards.values()) for event_id in shard.ids]
+
+    def _shard(self, name):
+        # Caller holds the lock
+        shard = self.shards.get(name)
+        if shard is None:
+            shard = self.shards[name] = self.make_shard()
+        return shard
+
+    def _group(self, event_ids):
+        # Caller holds the lock. Indexed ids per shard name, in input order
+        groups = {}
+        for event_id in map(str, event_ids):
+            name = self.shard_of.get(event_id)
+            if name is not None:
+                groups.setdefault(name, []).append(event_id)
+        return groups
+
+    def _executor(self):
+        # Threads do not survive fork: each (pre)forked worker process starts its own pool
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="shard")
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _map(self, fn, items):
+        if len(items) == 1:
+            return [fn(items[0])]
+        return list(self._executor().map(fn, items))
+
+    def upsert(self, events, texts, embed):
+        """Route events to their shards (moving those whose key changed); returns the number embedded."""
+        with self._lock:
+            # The last occurrence of an id in the batch wins, as in EventIndex.upsert
+            latest = {str(event["event_id"]): i for i, event in enumerate(events)}
+            groups = {}
+            moved = {}
+            for event_id, i in latest.items():
+                name = shard_name(events[i].get(self.key))
+                previous = self.shard_of.get(event_id)
+                if previous is not None and previous != name:
+                    moved.setdefault(previous, []).append(event_id)
+                groups.setdefault(name, []).append(i)
+            for name, event_ids in moved.items():
+                self.shards[name].delete(event_ids)
+            embedded = 0
+            for name, positions in groups.items():
+                embedded += self._shard(name).upsert(
+                    [events[i] for i in positions], [texts[i] for i in positions], embed
+                )
+                for i in positions:
+                    self.shard_of[str(events[i]["event_id"])] = name
+            self.version += 1
+            return embedded
+
+    def delete(self, event_ids):
+        with self._lock:
+            removed = 0
+            for name, event_ids in self._group(event_ids).items():
+                removed += self.shards[name].delete(event_ids)
+                for event_id in event_ids:
+                    self.shard_of.pop(event_id, None)
+            if removed:
+                self.version += 1
+            return removed
+
+    def set_active(self, event_ids, active):
+        with self._lock:
+            changed = sum(self.shards[name].set_active(ids, active) for name, ids in self._group(event_ids).items())
+            if changed:
+                self.version += 1
+            return changed
+
+    def expired(self, now=None):
+        return sum(shard.expired(now) for shard in list(self.shards.values()))
+
+    def expire(self, now=None):
+        with self._lock:
+            expired = []
+            for shard in self.shards.values():
+                expired += shard.expire(now)
+            for event_id in expired:
+                self.shard_of.pop(event_id, None)
+            if expired:
+                self.version += 1
+            return expired
+
+    def upcoming(self, event_ids, now=None):
+        with self._lock:
+            keep = set()
+            for name, ids in self._group(event_ids).items():
+                keep.update(self.shards[name].upcoming(ids, now))
+        return [event_id for event_id in event_ids if str(event_id) in keep]
+
+    def categories(self, event_ids):
+        with self._lock:
+            categories = {}
+            for name, ids in self._group(event_ids).items():
+                categories.update(self.shards[name].categories(ids))
+            return categories
+
+    def fingerprint(self, event_ids):
+        """Same digest as ``EventIndex.fingerprint`` over the events' own shards."""
+        with self._lock:
+            states = {}
+            for name, ids in self._group(event_ids).items():
+                states.update(zip(ids, self.shards[name].states(ids)))
+        return states_fingerprint(event_ids, [states.get(str(event_id), "-") for event_id in event_ids])
+
+    def _select(self, categories=None, fields=None):
+        """Non-empty shards a query can match: those its filter on the key names, else all of them."""
+        values = (fields or {}).get(self.key)
+        if values is None and self.key == "category" and categories:
+            values = categories
+        with self._lock:
+            if values is None:
+                return [shard for shard in self.shards.values() if len(shard)]
+            if isinstance(values, str):
+                values = [values]
+            names = {shard_name(value) for value in values}
+            return [shard for name, shard in self.shards.items() if name in names and len(shard)]
+
+    def search(self, user_embedding, threshold, categories=None, exclude_ids=None, top_k=None, sort_by="date",
+               query_text=None, boosts=None, window=None, fields=None):
+        """``EventIndex.search`` over the selected shards in parallel, merged into one ranking."""
+        selected = self._select(categories, fields)
+        if not selected:
+            return []
+
+        def search_shard(shard):
+            return shard.search(user_embedding, threshold, categories, exclude_ids, top_k, sort_by,
+                                query_text=query_text, boosts=boosts, window=window, scored=True, fields=fields)
+
+        self.stages.increment("shard_searches_total", len(selected))
+        with self.stages.time("shards"):
+            results = self._map(search_shard, selected)
+        with self.stages.time("merge"):
+            return merge(results, top_k, sort_by)
+
+    def search_batch(self, user_embeddings, threshold, filters=None, top_k=None, sort_by="date", boosts=None):
+        """``EventIndex.search_batch`` per shard for the users whose filters select it."""
+        n_users = len(user_embeddings)
+        filters = filters or [(None, None, None, None)] * n_users
+        users_of = {}
+        for u in range(n_users):
+            categories, _, _, fields = filters[u]
+            for shard in self._select(categories, fields):
+                users_of.setdefault(id(shard), (shard, []))[1].append(u)
+        work = list(users_of.values())
+
+        def search_shard(item):
+            shard, users = item
+            return shard.search_batch(
+                user_embeddings[users], threshold, [filters[u] for u in users], top_k, sort_by,
+                boosts=[boosts[u] for u in users] if boosts else None, scored=True,
+            )
+
+        self.stages.increment("shard_searches_total", len(work))
+        with self.stages.time("shards"):
+            results = self._map(search_shard, work) if work else []
+        per_user = [[] for _ in range(n_users)]
+        for (_, users), hits in zip(work, results):
+            for u, user_hits in zip(users, hits):
+                per_user[u].append(user_hits)
+        with self.stages.time("merge"):
+            return [merge(lists, top_k, sort_by) for lists in per_user]
+
+    @staticmethod
+    def _shard_dir(name):
+        # Field values are free text, so shard directories are named by digest
+        return os.path.join("shards", hashlib.sha1(name.encode()).hexdigest()[:16])
+
+    def save_snapshot(self, directory, keep=3, model=None):
+        """Snapshot the shards changed since their last save and publish a manifest of all shard versions."""
+        with self._lock:
+            listing = {}
+            for name, shard in self.shards.items():
+                path = self._shard_dir(name)
+                if self._saved.get(name) != shard.version or not shard.snapshot:
+                    shard.save_snapshot(os.path.join(directory, path), keep=keep, model=model)
+                    self._saved[name] = shard.version
+                listing[name] = {"path": path, "snapshot": shard.snapshot}
+            manifest = {
+                "shard_key": self.key, "shards": listing, "model": model,
+                "index_version": self.version, "journal": self.journal,
+            }
+            self.snapshot = snapshots.write(directory, {}, manifest, keep=keep)
+            return self.snapshot
+
+    def load_snapshot(self, directory, model=None):
+        """Load the published manifest; only shards whose version changed are reloaded.
+
+        Returns the number of events restored (0 when there is nothing usable).
+        """
+        path = snapshots.current_path(directory)
+        if path is None:
+            return 0
+        manifest = snapshots.read_manifest(path)
+        if manifest.get("shard_key") != self.key or (model and manifest.get("model") not in (None, model)):
+            logger.warning(f"Ignoring snapshot {path}: not sharded by {self.key} for {model}")
+            return 0
+        # Changed shards load into fresh indexes first; searches only wait for the swap
+        shards = {}
+        for name, entry in manifest["shards"].items():
+            shard = self.shards.get(name)
+            if shard is None or shard.snapshot != entry["snapshot"]:
+                shard = self.make_shard()
+                shard.load_snapshot(os.path.join(directory, entry["path"]), model=model)
+            shards[name] = shard
+        with self._lock:
+            self.shards = shards
+            self.shard_of = {event_id: name for name, shard in shards.items() for event_id in shard.ids}
+            self._saved = {name: shard.version for name, shard in shards.items()}
+            self.version += 1
+            self.snapshot = manifest["snapshot"]
+            self.journal = manifest.get("journal", 0)
+            n = len(self.shard_of)
+        logger.info(f"Loaded sharded snapshot {path} ({n} events in {len(shards)} shards)")
+        return n
+
+    def stats(self):
+        with self._lock:
+            shards = {name: shard.stats() for name, shard in self.shards.items()}
+            return {
+                "shard_key": self.key,
+                "shards": len(shards),
+                "size": sum(s["size"] for s in shards.values()),
+                "active": sum(s["active"] for s in shards.values()),
+                "embedding_bytes": sum(s["embedding_bytes"] for s in shards.values()),
+                "version": self.version,
+                "shard_sizes": {name: s["size"] for name, s in shards.items()},
+                "workers": self.workers,
+            }
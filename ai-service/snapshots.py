@@ -0,0 +1,133 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Pointer file naming the snapshot version to load
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+
+
+def _version_name(version):
+    return f"v{version:08d}"
+
+
+def list_versions(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        int(name[1:]) for name in os.listdir(directory)
+        if name.startswith("v") and name[1:].isdigit()
+    )
+
+
+def current_version(directory):
+    try:
+        with open(os.path.join(directory, CURRENT)) as f:
+            return int(f.read().strip()[1:])
+    except (OSError, ValueError):
+        return 0
+
+
+@contextmanager
+def locked(directory):
+    """Exclusive cross-process lock on ``directory`` (an flock on its ``.lock`` file)."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def current_path(directory):
+    """Directory of the published snapshot, or None."""
+    try:
+        with open(os.path.join(directory, CURRENT)) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.exists(os.path.join(path, MANIFEST)) else None
+
+
+def _save(path, array, spare=0):
+    # ``spare`` zero rows after the array's own, written straight to the file
+    if not spare:
+        np.save(path, array)
+        return
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=array.dtype, shape=(len(array) + spare, *array.shape[1:]))
+    out[:len(array)] = array
+    out.flush()
+    del out
+
+
+def write(directory, arrays, manifest, documents=None, keep=3, spare=None):
+    """Write a new snapshot version (``.npy`` arrays, ``.json`` documents) and publish it.
+
+    The version is staged under a temporary name and renamed into place, and
+    ``CURRENT`` is swapped atomically, so readers never see a partial snapshot.
+    ``spare`` ({key: rows}) pads arrays with zero rows that a memory-mapped
+    load can fill in place.
+    """
+    os.makedirs(directory, exist_ok=True)
+    versions = list_versions(directory)
+    version = versions[-1] + 1 if versions else 1
+    name = _version_name(version)
+    staging = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    os.makedirs(staging)
+    try:
+        for key, array in arrays.items():
+            _save(os.path.join(staging, f"{key}.npy"), array, (spare or {}).get(key, 0))
+        for key, document in (documents or {}).items():
+            with open(os.path.join(staging, f"{key}.json"), "w") as f:
+                json.dump(document, f)
+        with open(os.path.join(staging, MANIFEST), "w") as f:
+            json.dump({
+                **manifest,
+                "snapshot": version,
+                "created_at": time.time(),
+                "arrays": sorted(arrays),
+                "documents": sorted(documents or {}),
+            }, f)
+        os.rename(staging, os.path.join(directory, name))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(directory, f".{CURRENT}.{os.getpid()}.tmp")
+    with open(pointer, "w") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(directory, CURRENT))
+
+    for old in list_versions(directory)[:-keep] if keep else ():
+        shutil.rmtree(os.path.join(directory, _version_name(old)), ignore_errors=True)
+    return version
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def read(path, mmap=True):
+    """Manifest, arrays and documents of one snapshot version.
+
+    With ``mmap`` the arrays are copy-on-write memory maps: every process that
+    loads the same version shares the page-cache pages until it writes a row.
+    """
+    manifest = read_manifest(path)
+    arrays = {
+        key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode="c" if mmap else None)
+        for key in manifest["arrays"]
+    }
+    documents = {}
+    for key in manifest["documents"]:
+        with open(os.path.join(path, f"{key}.json")) as f:
+            documents[key] = json.load(f)
+    return manifest, arrays, documents
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class TemporalIndex:
+    """Event rows kept sorted by start time (ties broken by row number).
+
+    Two aligned arrays hold the sorted ``(date, row)`` pairs, so a time
+    window is two binary searches and a slice. Inserts and removals find
+    their positions by binary search too and shift the arrays once per
+    batch; the owning index reports row moves as a remove plus an insert.
+    """
+
+    def __init__(self):
+        self.dates = np.zeros(0, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def build(self, dates):
+        """Index rows ``0..len(dates)-1`` from scratch."""
+        dates = np.asarray(dates, dtype=np.int64)
+        rows = np.arange(len(dates), dtype=np.int64)
+        order = np.lexsort((rows, dates))
+        self.dates, self.rows = dates[order], rows[order]
+
+    def _position(self, date, row):
+        lo = np.searchsorted(self.dates, date, "left")
+        hi = np.searchsorted(self.dates, date, "right")
+        return lo + np.searchsorted(self.rows[lo:hi], row)
+
+    def insert(self, dates, rows):
+        if not len(rows):
+            return
+        dates = np.asarray(dates, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.lexsort((rows, dates))
+        dates, rows = dates[order], rows[order]
+        positions = [self._position(date, row) for date, row in zip(dates, rows)]
+        self.dates = np.insert(self.dates, positions, dates)
+        self.rows = np.insert(self.rows, positions, rows)
+
+    def remove(self, dates, rows):
+        if not len(rows):
+            return
+        positions = [self._position(date, row) for date, row in zip(dates, rows)]
+        self.dates = np.delete(self.dates, positions)
+        self.rows = np.delete(self.rows, positions)
+
+    def window(self, start=None, end=None):
+        """Rows starting in ``(start, end]`` (epoch seconds; None leaves that side open)."""
+        lo = 0 if start is None else np.searchsorted(self.dates, start, "right")
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, end, "right")
+        return self.rows[lo:max(lo, hi)]
+
+    def count_until(self, end):
+        """Number of rows starting at or before ``end``."""
+        return int(np.searchsorted(self.dates, end, "right"))
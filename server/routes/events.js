@@ -3,6 +3,7 @@ import { body, validationResult, query } from 'express-validator';
 import Event from '../models/Event.js';
 import Registration from '../models/Registration.js';
 import { authenticate, authorize } from '../middleware/auth.js';
+import { syncEvents, deactivateEvents, syncInBackground } from '../utils/aiService.js';
 
 const router = express.Router();
 
@@ -165,6 +166,7 @@ router.post('/', authenticate, authorize('admin'), [
 
     const event = new Event(eventData);
     await event.save();
+    syncInBackground(syncEvents([event]));
 
     const populatedEvent = await Event.findById(event._id)
       .populate('createdBy', 'name email');
@@ -216,6 +218,7 @@ router.put('/:id', authenticate, authorize('admin'), [
     });
 
     await event.save();
+    syncInBackground(syncEvents([event]));
 
     const updatedEvent = await Event.findById(event._id)
       .populate('createdBy', 'name email');
@@ -241,6 +244,7 @@ router.delete('/:id', authenticate, authorize('admin'), async (req, res) => {
     // Soft delete - mark as inactive instead of removing
     event.isActive = false;
     await event.save();
+    syncInBackground(deactivateEvents([event._id]));
 
     res.json({ message: 'Event deleted successfully' });
   } catch (error) {
@@ -3,9 +3,23 @@ import axios from 'axios';
 import Event from '../models/Event.js';
 import Registration from '../models/Registration.js';
 import { authenticate } from '../middleware/auth.js';
+import { ingestEvents, syncInteractions, fetchPopularEventIds } from '../utils/aiService.js';
 
 const router = express.Router();
 
+// Last AI ranking per student: on a 304 the same ids are looked up again, so fields
+// the AI service does not track (e.g. maxAttendees) are never served stale
+const recommendationCache = new Map();
+const RECOMMENDATION_CACHE_SIZE = 1000;
+
+const rememberRecommendations = (userId, etag, eventIds) => {
+  recommendationCache.delete(userId);
+  recommendationCache.set(userId, { etag, eventIds });
+  if (recommendationCache.size > RECOMMENDATION_CACHE_SIZE) {
+    recommendationCache.delete(recommendationCache.keys().next().value);
+  }
+};
+
 // Get AI recommendations for user
 router.get('/', authenticate, async (req, res) => {
   console.log('📩 GET /api/recommendations triggered');
@@ -22,16 +36,23 @@ router.get('/', authenticate, async (req, res) => {
       isActive: true
     }).populate('event');
 
-    // Get all active events
-    const allEvents = await Event.find({
-      isActive: true,
-      date: { $gt: new Date() } // Only future events
-    });
-    
 
     // Check if user has any interactions
-    if (userRegistrations.length === 0 || !req.user.interests || req.user.interests.length === 0) {
-      // Return popular events as fallback
+    const needsFallback = userRegistrations.length === 0 || !req.user.interests || req.user.interests.length === 0;
+    if (needsFallback) {
+      // Return popular events as fallback, ranked by the AI service's decayed counters
+      try {
+        const popularIds = await fetchPopularEventIds(5);
+        const popularEvents = await Event.find({ _id: { $in: popularIds } });
+        req.fallbackEvents = popularIds
+          .map(id => popularEvents.find(event => event._id.toString() === id))
+          .filter(Boolean);
+      } catch (popularError) {
+        console.error('AI popularity lookup failed:', popularError.message);
+      }
+    }
+    if (needsFallback && !req.fallbackEvents?.length) {
+      // The AI service is down or its counters are not seeded yet: count registrations in Mongo
       const popularEvents = await Event.aggregate([
         { $match: { isActive: true, date: { $gt: new Date() } } },
         {
@@ -87,6 +108,7 @@ const effectiveInterests =
 };*/
 // Prepare data for AI service
 const recommendationData = {
+  user_id: req.user._id.toString(),
   user_profile: {
     interests: effectiveInterests,
     skills: req.user.skills || [],
@@ -99,12 +121,8 @@ const recommendationData = {
     eventObj.event_id = reg.event._id.toString(); // ensure ID is included
     eventObj.rating = reg.rating || null; // add rating if available
     return eventObj;
-  }),
-  all_events: allEvents.map(event => {
-    const eventObj = event.toObject(); // all fields
-    eventObj.event_id = event._id.toString(); // add event_id for consistency
-    return eventObj;
   })
+  // Events are not sent: the AI service keeps its own index (see utils/aiService.js)
 };
 
 
@@ -122,13 +140,36 @@ const recommendationData = {
       console.log(`🔍 Calling AI Service at: ${aiServiceUrl}/recommend`);  // <-- debug log
       // console.log('📤 Sending payload:', JSON.stringify(recommendationData, null, 2)); // log request data
 
-      const aiResponse = await axios.post(`${aiServiceUrl}/recommend`, recommendationData, {
-        timeout: 30000 // 10 second timeout
+      const userId = req.user._id.toString();
+      const cached = recommendationCache.get(userId);
+      let aiResponse = await axios.post(`${aiServiceUrl}/recommend`, recommendationData, {
+        timeout: 30000, // 10 second timeout
+        headers: cached ? { 'If-None-Match': cached.etag } : {},
+        validateStatus: status => status === 200 || status === 304
       });
 
+      // Same recommendations for the same event versions: reuse the cached ranking
+      const notModified = aiResponse.status === 304;
+
+      // A freshly started AI service has an empty index: seed it once, then retry
+      if (!notModified && aiResponse.data.index_size === 0) {
+        const futureEvents = Event.find({
+          isActive: true,
+          date: { $gt: new Date() } // Only future events
+        }).cursor();
+        await ingestEvents(futureEvents);
+        // Its co-registration model starts empty as well
+        const registrations = await Registration.find({ isActive: true })
+          .select('user event rating registrationDate isActive');
+        await syncInteractions(registrations);
+        aiResponse = await axios.post(`${aiServiceUrl}/recommend`, recommendationData, {
+          timeout: 30000
+        });
+      }
+
       // console.log('✅ AI Service response:', aiResponse.data); // <-- debug log
 
-      const recommendedEventIds = aiResponse.data.recommendations;
+      const recommendedEventIds = notModified ? cached.eventIds : aiResponse.data.recommendations;
       console.log("🛠 Checking fallback condition");
 
       if (!recommendedEventIds || recommendedEventIds.length === 0) {
@@ -153,6 +194,10 @@ const recommendationData = {
         recommendedEvents.find(event => event._id.toString() === id)
       ).filter(Boolean);
 
+      if (!notModified && aiResponse.headers.etag) {
+        rememberRecommendations(userId, aiResponse.headers.etag, recommendedEventIds);
+      }
+
       res.json(sortedEvents);
 
     } catch (aiError) {
@@ -4,6 +4,7 @@ import Registration from '../models/Registration.js';
 import Event from '../models/Event.js';
 import { authenticate } from '../middleware/auth.js';
 import { sendRegistrationEmail } from '../utils/emailService.js';
+import { syncInteractions, syncInBackground } from '../utils/aiService.js';
 
 const router = express.Router();
 
@@ -58,6 +59,7 @@ router.post('/', authenticate, [
     });
 
     await registration.save();
+    syncInBackground(syncInteractions([registration]));
 
     // Populate registration data
     const populatedRegistration = await Registration.findById(registration._id)
@@ -139,6 +141,7 @@ router.delete('/:eventId', authenticate, async (req, res) => {
     // Soft delete registration
     registration.isActive = false;
     await registration.save();
+    syncInBackground(syncInteractions([registration]));
 
     res.json({ message: 'Registration cancelled successfully' });
   } catch (error) {
@@ -183,6 +186,7 @@ router.post('/rate', authenticate, [
     registration.feedback = feedback;
     registration.attended = true;
     await registration.save();
+    syncInBackground(syncInteractions([registration]));
 
     res.json({
       message: 'Event rated successfully',
@@ -3,6 +3,7 @@ import dotenv from 'dotenv';
 import User from '../models/User.js';
 import Event from '../models/Event.js';
 import Registration from '../models/Registration.js';
+import { ingestEvents } from '../utils/aiService.js';
 
 dotenv.config();
 
@@ -220,6 +221,17 @@ async function seedDatabase() {
     await Registration.create(registrations);
     console.log('📝 Created registrations:', registrations.length);
 
+    // Reload the AI service's event index from the fresh catalogue, if it is running
+    try {
+      const result = await ingestEvents(Event.find({ isActive: true }).cursor(), {
+        replace: true,
+        onProgress: progress => console.log(`🤖 Indexed ${progress.ingested} events...`)
+      });
+      console.log(`🤖 AI index reloaded: ${result.index_size} events (${result.errors} rejected)`);
+    } catch (aiError) {
+      console.warn('⚠️  AI service index not reloaded:', aiError.message);
+    }
+
     console.log('\n✅ Database seeded successfully!');
     console.log('\n📊 Summary:');
     console.log(`👥 Users: ${users.length} (1 admin, ${studentUsers.length} students)`);
@@ -0,0 +1,93 @@
+import axios from 'axios';
+import { Readable } from 'stream';
+
+const aiServiceUrl = () => process.env.AI_SERVICE_URL || 'http://127.0.0.1:8000';
+
+// Only the fields the AI service embeds or filters on
+export const toAiEvent = (event) => ({
+  event_id: event._id.toString(),
+  name: event.name,
+  description: event.description,
+  category: event.category,
+  location: event.location,
+  targetAudience: event.targetAudience,
+  tags: event.tags,
+  date: event.date,
+  isActive: event.isActive
+});
+
+// Push new or edited events into the AI service index
+export const syncEvents = async (events) => {
+  if (!events.length) return;
+  await axios.post(`${aiServiceUrl()}/events`, {
+    events: events.map(toAiEvent)
+  }, { timeout: 30000 });
+};
+
+// Stream a whole catalogue (e.g. a Mongo cursor) as NDJSON; neither side holds it in memory.
+// With replace, indexed events missing from the stream are dropped. Resolves to the final progress record.
+export const ingestEvents = async (events, { replace = false, onProgress } = {}) => {
+  const body = Readable.from((async function* () {
+    for await (const event of events) {
+      yield JSON.stringify(toAiEvent(event)) + '\n';
+    }
+  })());
+  const response = await axios.post(`${aiServiceUrl()}/events/ingest`, body, {
+    params: replace ? { replace: 1 } : {},
+    headers: { 'Content-Type': 'application/x-ndjson' },
+    responseType: 'stream',
+    maxBodyLength: Infinity,
+    timeout: 0
+  });
+
+  let progress = null;
+  let buffered = '';
+  response.data.setEncoding('utf8');
+  for await (const chunk of response.data) {
+    buffered += chunk;
+    const lines = buffered.split('\n');
+    buffered = lines.pop();
+    for (const line of lines.filter(Boolean)) {
+      progress = JSON.parse(line);
+      if (progress.error) throw new Error(progress.error);
+      if (onProgress) onProgress(progress);
+    }
+  }
+  return progress;
+};
+
+export const deactivateEvents = async (eventIds) => {
+  await axios.post(`${aiServiceUrl()}/events/deactivate`, {
+    event_ids: eventIds.map(id => id.toString())
+  }, { timeout: 10000 });
+};
+
+const toAiInteraction = (registration) => ({
+  user_id: (registration.user?._id || registration.user).toString(),
+  event_id: (registration.event?._id || registration.event).toString(),
+  rating: registration.rating ?? null,
+  registeredAt: registration.registrationDate,
+  isActive: registration.isActive
+});
+
+// Registrations (and cancellations, with isActive false) feed the co-registration model
+export const syncInteractions = async (registrations) => {
+  if (!registrations.length) return;
+  await axios.post(`${aiServiceUrl()}/interactions`, {
+    interactions: registrations.map(toAiInteraction)
+  }, { timeout: 30000 });
+};
+
+// Most popular upcoming events (time-decayed registration counts), most popular first
+export const fetchPopularEventIds = async (limit, category) => {
+  const response = await axios.get(`${aiServiceUrl()}/popular`, {
+    params: { k: limit, ...(category ? { category } : {}) },
+    timeout: 5000
+  });
+  return response.data.events.map(event => event.event_id);
+};
+
+// Index updates are best effort; /recommend reseeds an empty index on demand
+export const syncInBackground = (promise) => {
+  promise.catch(error => console.error('AI index sync failed:', error.message));
+};